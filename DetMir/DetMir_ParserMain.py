@@ -1,29 +1,31 @@
-from bs4 import BeautifulSoup
 # import nordvpn_switcher as ns
-from settings import DetMir_headers, detmir_table_structure
-from core import save_row, save_options, get_new_session, get_new_headers, create_table, user_agent_rotator
-import json
+from settings import DetMir_headers, DetMir_timeout, detmir_table_structure, detmir_table_indexes, \
+    incremental_stop_pages, full_parse_interval
+from core import save_row, save_options, get_new_session, get_new_headers, open_sink, use_writer, user_agent_rotator, \
+    get_number, crawl_pages, get_revalidated, DiskCache, get_rate_limiter, iter_script_json, \
+    save_rows, get_revalidated_text, Checkpoint, with_checkpoint, PageFingerprints, get_seen_set, \
+    get_key_index, DeferredCache, check_partial_parse, NoDataError
 
 temp_url = 'https://www.detmir.ru/catalog/index/name/sortforbrand/brand/13201/page/1/'
 
 
-def get_json_data(url, session):
+def get_products(url, session, response_cache=None):
     """
-    Gets initial json data of the given page
+    Gets products of the given page without decoding the rest of the page data. Products are decoded one by one
+    while they are consumed
 
-    :param url: Must be a correct link to a page with product list or an individual product page on detmir.ru
+    :param url: Must be a correct link to a page with product list on detmir.ru
     :param session: requests.Session object of the current session
-    :return: Page data converted into python structure
-    :rtype: dict
+    :param response_cache: DiskCache of pages' validators. If passed, an unchanged page is not parsed
+    :return: Products converted into python structure. If the page has not changed returns None.
+    NoDataError is raised if the page has no data
+    :rtype: generator
     """
 
-    response = session.get(url).text
-    soup = BeautifulSoup(response, 'html.parser')
-    json_text = str(soup.find('script', {'id': 'app-data'}))
-    json_text = json_text[json_text.find('{'):json_text.rfind("</script>")]
-    json_text = json_text.replace('&quot;', '"')
-    json_data = json.loads(json_text)
-    return json_data
+    response = get_revalidated(session, url, response_cache)
+    if response.unchanged:
+        return None
+    return iter_script_json(response.text, 'catalog.data.items.item', 'app-data')
 
 
 def get_name(product):
@@ -87,10 +89,10 @@ def get_rating(product):
 
     :param product: Must be a correct json of product information
     :return: rating
-    :rtype: str
+    :rtype: float
     """
 
-    rating = str(product['rating'])
+    rating = get_number(product['rating'], float)
     return rating
 
 
@@ -185,20 +187,23 @@ def get_url(base_url, current_page_number):
 
 def get_page_amount(url, session):
     """
-    Gets amount of product pages
+    Gets amount of product pages together with products of the first page, so the page is not downloaded again
 
     :param url: first page url
     :param session: requests.Session object of the current session
-    :return: page amount
-    :rtype: int
+    :return: page amount and products of the first page in the format of 'get_products'
+    :rtype: tuple
     """
 
-    json_data = get_json_data(url, session)
-    product_amount = int(json_data['catalog']['data']['meta']['length'])
+    response = session.get(url).text
+    product_amount = next(iter_script_json(response, 'catalog.data.meta.length', 'app-data'), None)
+    if product_amount is None:
+        raise NoDataError(f'Нет количества товаров на странице {url}')
+    product_amount = int(product_amount)
     page_amount = product_amount // 30
     if product_amount % 30 != 0:
         page_amount += 1
-    return page_amount
+    return page_amount, iter_script_json(response, 'catalog.data.items.item', 'app-data')
 
 
 def get_product_info(product, current_page_number, product_position):
@@ -228,49 +233,152 @@ def get_product_info(product, current_page_number, product_position):
     return row
 
 
-def parse_page(base_url, current_page_number, save_option, session, table_name=''):
+def get_rows(products, current_page_number):
+    """
+    Gets information on all products of a page
+
+    :param products: Must be correct jsons of a page's products, e.g. a generator from 'get_products'
+    :param current_page_number:
+    :return: Products' information in the same order as in database
+    :rtype: list
+    """
+
+    return [get_product_info(product, current_page_number, i) for i, product in enumerate(products)]
+
+
+def extract_rows(page, current_page_number):
+    """
+    Gets information on all products from html of a page. Used by parsing processes of 'crawl_pages'
+
+    :param page: Html of a page with product list
+    :param current_page_number:
+    :return: Products' information in the same order as in database
+    :rtype: list
+    """
+
+    return get_rows(iter_script_json(page, 'catalog.data.items.item', 'app-data'), current_page_number)
+
+
+def save_products(products, current_page_number, sink, seen=None):
+    """
+    Saves all products of a page
+
+    :param products: Must be correct jsons of a page's products, e.g. a generator from 'get_products'.
+    If None, nothing is saved
+    :param current_page_number:
+    :param sink: Sink of the current parse made by 'open_sink'
+    :param seen: Seen set of the parse from 'get_seen_set'. Products seen on earlier pages are skipped
+    :return:
+    """
+
+    if products is None:
+        return
+    for i, product in enumerate(products):
+        if seen is not None and not seen.add(get_product_code(product)):
+            continue
+        row = get_product_info(product, current_page_number, i)
+        save_row(row, sink)
+
+
+def get_session(base_url):
+    """
+    Makes the session of the shop for the given product list
+
+    :param base_url: Must be a url in the form of 'https://www.detmir.ru/*/'
+    :return: session with headers and cookies
+    :rtype: requests.Session
+    """
+
+    headers = get_new_headers(DetMir_headers, user_agent_rotator)
+    return get_new_session(url=get_url(base_url, 1), headers=headers, shop_name='DetMir', timeout=DetMir_timeout,
+                           rate_limiter=get_rate_limiter())
+
+
+def parse_page(base_url, current_page_number, sink, session, page_data=None):
     """
     Parses all products on the given page
 
     :param base_url: Must be a url in the form of 'https://www.detmir.ru/*/'
     :param current_page_number:
-    :param save_option: Must be a supported save option from 'save_options' dict
+    :param sink: Sink of the current parse made by 'open_sink'
     :param session: requests.Session object of the current session
-    :param table_name: If saving into sql db, must be a name of an existing table in the database
+    :param page_data: Data of the page returned by 'get_page_amount'. The page is downloaded if None
     :return:
     """
 
-    page_url = get_url(base_url, current_page_number)
-    print(page_url)
-    json_data = get_json_data(url=page_url, session=session)
-    for i in range(len(json_data['catalog']['data']['items'])):
-        row = get_product_info(json_data['catalog']['data']['items'][i], current_page_number, i)
-        save_row(row, table_name, save_option, detmir_table_structure)
+    if page_data is None:
+        page_url = get_url(base_url, current_page_number)
+        print(page_url)
+        page_data = get_products(page_url, session)
+    products = page_data
+    save_products(products, current_page_number, sink)
 
 
-def run_parser(base_url, save_option):
+def run_parser(base_url, save_option, concurrency=1, requests_per_second=None, revalidate=False, proxy_pool=None,
+               parse_processes=0, writer=None, resume=False, incremental=False, per_host=None):
     """
     Main function of the parser. Gets all products information from the given list and saves it according to
     the chosen save option
 
     :param base_url: Must be a url in the form of 'https://www.detmir.ru/*/'
     :param save_option: Must be a supported save option from 'save_options' dict
+    :param concurrency: Maximum amount of simultaneously fetched pages
+    :param requests_per_second: Maximum amount of page requests per second. Not limited if None
+    :param revalidate: If True, pages that have not changed since the previous parse are not parsed and saved.
+    Can only be used with the '.history' save option
+    :param proxy_pool: ProxyPool that gives every fetching thread its own session. If None, the shop's session is
+    used
+    :param parse_processes: Amount of processes that extract products from pages. If 0, products are extracted
+    in the fetching threads
+    :param writer: RowWriter shared with other parses. A new writer is made if None
+    :param resume: If True, the last unfinished parse of the url is continued from its last saved page into
+    the same table
+    :param incremental: If True, the parse stops once 'incremental_stop_pages' consecutive pages are equal to
+    the previous parse, unless the last full parse is older than 'full_parse_interval'. Meant for lists sorted
+    by newest or by price. Can only be used with the '.history' save option
+    :param per_host: Maximum amount of simultaneous requests to one host. Equal to concurrency if None
     :return:
     """
 
+    if revalidate:
+        check_partial_parse(save_option, 'revalidate')
+    if incremental:
+        check_partial_parse(save_option, 'incremental')
     url = get_url(base_url, 1)
-    headers = get_new_headers(DetMir_headers, user_agent_rotator)
-    session = get_new_session(url=url, headers=headers)
-
-    table_name = ''
-    if save_option == save_options['.db']:
-        table_name = create_table(detmir_table_structure, 'DetMir')
-
-    page_amount = get_page_amount(url, session)
-    for i in range(1, page_amount + 1):
-        parse_page(base_url, i, save_option, session, table_name)
-
-    input('Нажмите enter для выхода: ')
+    session = get_session(base_url)
+
+    def fetch(page_url):
+        print(page_url)
+        page_session = session if proxy_pool is None else proxy_pool.get_session()
+        if parse_processes:
+            return get_revalidated_text(page_session, page_url, response_cache if revalidate else None)
+        return get_products(page_url, page_session, response_cache if revalidate else None)
+
+    with Checkpoint('DetMir', base_url, resume) as checkpoint, \
+            PageFingerprints('DetMir', base_url, incremental, incremental_stop_pages,
+                             full_parse_interval) as fingerprints, \
+            DeferredCache(DiskCache('DetMir_responses', 7 * 24 * 60 * 60)) as response_cache, \
+            use_writer(writer) as writer, \
+            fingerprints.attach(writer.attach(open_sink(save_option, detmir_table_structure, 'DetMir',
+                                                        detmir_table_indexes, checkpoint=checkpoint)),
+                                detmir_table_structure) as sink:
+        page_amount, first_page = get_page_amount(url, session)
+        checkpoint.set_page_amount(page_amount)
+        # validators of a page are kept only once its rows are saved
+        checkpoint.on_pages_saved(lambda pages: response_cache.commit(get_url(base_url, page) for page in pages))
+        seen = get_seen_set(page_amount)
+        key_index = get_key_index(detmir_table_structure)
+        urls = checkpoint.get_remaining({i: get_url(base_url, i) for i in range(1, page_amount + 1)})
+        if parse_processes:
+            handle = fingerprints.track(with_checkpoint(lambda i, rows: save_rows(rows, sink, seen, key_index), sink))
+            crawl_pages(urls, fetch, handle, concurrency, requests_per_second=requests_per_second, per_host=per_host,
+                        fetched={1: get_rows(first_page, 1)}, parse=extract_rows, processes=parse_processes,
+                        stop=fingerprints.stop)
+        else:
+            handle = fingerprints.track(with_checkpoint(lambda i, products: save_products(products, i, sink, seen),
+                                                        sink))
+            crawl_pages(urls, fetch, handle, concurrency, requests_per_second=requests_per_second, per_host=per_host,
+                        fetched={1: first_page}, stop=fingerprints.stop)
 
 
 if __name__ == '__main__':
@@ -278,3 +386,4 @@ if __name__ == '__main__':
     # ns.initialize_VPN(save=1, area_input=['complete rotation'], stored_settings=1)
     run_parser('https://www.detmir.ru/catalog/index/name/sortforbrand/brand/13201/', save_options['.db'])
     # ns.terminate_VPN()
+    input('Нажмите enter для выхода: ')
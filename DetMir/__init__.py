@@ -1 +1 @@
-from .DetMir_ParserMain import get_json_data
+from .DetMir_ParserMain import get_products
@@ -1,8 +1,9 @@
-from bs4 import BeautifulSoup
-import requests
-import json
-from core import save_row, save_options, create_table
-from settings import myshop_table_structure
+from concurrent.futures import ThreadPoolExecutor
+from core import get_number, save_row, save_options, open_sink, use_writer, crawl_pages, DiskCache, \
+    get_shared_session, get_new_headers, user_agent_rotator, get_revalidated, get_rate_limiter, get_script_json, \
+    Checkpoint, with_checkpoint, PageFingerprints, get_seen_set, DeferredCache, check_partial_parse, NoDataError
+from settings import myshop_table_structure, myshop_table_indexes, MyShop_headers, MyShop_timeout, \
+    incremental_stop_pages, full_parse_interval
 
 temp_url = 'https://my-shop.ru/shop/producer/149/sort/b/page/'
 
@@ -12,12 +13,12 @@ def get_lower_price(product):
     Gets a discounted(if on sale) price of a given product
 
     :param product: Must be a correct json of product information
-    :return: Price in a format convertible into int
-    :rtype: str
+    :return: Price
+    :rtype: int
     """
 
-    price = product['cost']
-    return str(price)
+    price = get_number(product['cost'])
+    return price
 
 
 def get_sale_percentage(product):
@@ -25,28 +26,28 @@ def get_sale_percentage(product):
     Gets sale percentage(if on sale) of the given product
 
     :param product: Must be a correct json of product information
-    :return: Sale percentage in a format convertible into int
-    :rtype: str
+    :return: Sale percentage
+    :rtype: int
     """
 
     if product['promos']:
-        return str(product['promos'][0]['discount'])
+        return get_number(product['promos'][0]['discount'])
     else:
-        return '0'
+        return 0
 
 
 def get_non_sale_price(product):
     """
     Gets product's price before sale if one is in effect. Otherwise returns current price
     :param product: Must be a correct json of product information
-    :return: Price in a format convertible into int
-    :rtype: str
+    :return: Price
+    :rtype: int
     """
 
     if product['old_cost'] is None:
         return get_lower_price(product)
     else:
-        return str(product['old_cost'])
+        return get_number(product['old_cost'])
 
 
 def get_brand(product):
@@ -88,20 +89,24 @@ def get_name(product):
     return name
 
 
-def get_json_data(url):
+def get_json_data(url, session, response_cache=None):
     """
     Gets initial json data of the given page
 
     :param url: Must be a correct link to a page with product list or an individual product page on my-shop.ru
-    :return: Page data converted into python structure
+    :param session: requests.Session object of the current session
+    :param response_cache: DiskCache of pages' validators. If passed, an unchanged page is not parsed
+    :return: Page data converted into python structure. If the page has not changed returns None.
+    NoDataError is raised if the page has no data
     :rtype: dict
     """
 
-    response = requests.get(url).text
-    soup = BeautifulSoup(response, 'html.parser')
-    json_text = str(soup.find_all('script')[1])
-    json_text = json_text[json_text.find('{'):json_text.rfind('};') + 1]
-    json_data = json.loads(json_text)
+    response = get_revalidated(session, url, response_cache)
+    if response.unchanged:
+        return None
+    json_data = get_script_json(response.text, index=1, end='};', unescape=False)
+    if json_data is None or 'response' not in json_data:
+        raise NoDataError(f'Нет данных на странице {url}')
     return json_data['response']
 
 
@@ -148,21 +153,24 @@ def get_url(base_url, page_number):
     return f"{base_url}{page_number}.html"
 
 
-def get_page_amount(base_url):
+def get_page_amount(base_url, session):
     """
-    Gets amount of pages of the product list
+    Gets amount of pages of the product list together with data of the first page, so the page is not
+    downloaded again
 
     :param base_url: Must be a url in the form of 'https://my-shop.ru/*/page'
-    :return: Page amount
-    :rtype: int
+    :param session: requests.Session object of the current session
+    :return: Page amount and data of the first page
+    :rtype: tuple
     """
 
     url = get_url(base_url, 1)
-    json_data = get_json_data(url)
-    page_amount = json_data['meta']['total']
-    if page_amount % 36 == 0:
-        return page_amount // 36
-    return page_amount // 36 + 1
+    json_data = get_json_data(url, session)
+    product_amount = json_data['meta']['total']
+    page_amount = product_amount // 36
+    if product_amount % 36 != 0:
+        page_amount += 1
+    return page_amount, json_data
 
 
 def get_article(product):
@@ -178,13 +186,61 @@ def get_article(product):
     return str(article)
 
 
-def get_product_info(product, current_page_number, product_position):
+def get_product_details(article, session):
+    """
+    Gets details of a given product from its individual page
+
+    :param article: Product's article
+    :param session: requests.Session object of the current session
+    :return: Product's series and ISBN in a format of {'series': series, 'isbn': isbn}
+    :rtype: dict
+    """
+
+    product_url = f"https://my-shop.ru/shop/product/{article}.html"
+    json_data = get_json_data(product_url, session)
+    return {'series': get_series(json_data), 'isbn': get_isbn(json_data)}
+
+
+def get_details(products, session, cache=None, workers=8):
+    """
+    Gets details of all products of a page. Details found in the cache are not fetched,
+    the rest are fetched concurrently and saved into the cache
+
+    :param products: Must be a correct json of a page's product list
+    :param session: requests.Session object of the current session
+    :param cache: DiskCache of products' details. If None, details of all products are fetched
+    :param workers: Maximum amount of simultaneously fetched products' pages
+    :return: Details in a format of {article: details}
+    :rtype: dict
+    """
+
+    articles = [get_article(product) for product in products]
+    details = {}
+    if cache is not None:
+        for article in articles:
+            cached_details = cache.get(article)
+            if cached_details is not None:
+                details[article] = cached_details
+
+    missing_articles = [article for article in articles if article not in details]
+    if missing_articles:
+        with ThreadPoolExecutor(workers) as executor:
+            missing_details = executor.map(get_product_details, missing_articles, [session] * len(missing_articles))
+            for article, product_details in zip(missing_articles, missing_details):
+                details[article] = product_details
+                if cache is not None:
+                    cache.set(article, product_details)
+    return details
+
+
+def get_product_info(product, current_page_number, product_position, details):
     """
     Gets all required information on a given product
 
     :param product: Must be a correct json of product information
     :param current_page_number:
     :param product_position: Position of the given product on the page. Indexes start from 0
+    :param details: Product's details from 'get_details'
     :return: Product information in the same order as in database
     :rtype: tuple
     """
@@ -197,54 +253,129 @@ def get_product_info(product, current_page_number, product_position):
     popularity = product_position + 1 + 36 * (current_page_number - 1)
     image_src = get_image_src(product)
     name = get_name(product)
-    product_url = f"https://my-shop.ru/shop/product/{article}.html"
-    json_data = get_json_data(product_url)
-    series = get_series(json_data)
-    isbn = get_isbn(json_data)
+    series = details['series']
+    isbn = details['isbn']
     row = (brand, name, series, non_sale_price, sale_percentage, lower_price, popularity, image_src,
            article, isbn)
     return row
 
 
-def parse_page(base_url, current_page_number, save_option, table_name=''):
+def save_products(products, current_page_number, sink, session, cache=None, seen=None):
+    """
+    Saves all products of a page
+
+    :param products: Must be a correct json of a page's product list. If None, nothing is saved
+    :param current_page_number:
+    :param sink: Sink of the current parse made by 'open_sink'
+    :param session: requests.Session object of the current session
+    :param cache: DiskCache of products' details
+    :param seen: Seen set of the parse from 'get_seen_set'. Products seen on earlier pages are skipped before
+    their details are fetched
+    :return:
+    """
+
+    if products is None:
+        return
+    # positions of skipped products are kept, so the rest keep their ranks
+    positions = [i for i in range(len(products)) if seen is None or seen.add(get_article(products[i]))]
+    details = get_details([products[i] for i in positions], session, cache)
+    for i in positions:
+        row = get_product_info(products[i], current_page_number, i, details[get_article(products[i])])
+        save_row(row, sink)
+
+
+def get_session(base_url):
+    """
+    Makes the session of the shop for the given product list
+
+    :param base_url: Must be a url in the form of 'https://my-shop.ru/*/page'
+    :return: session
+    :rtype: ParserSession
+    """
+
+    headers = get_new_headers(MyShop_headers, user_agent_rotator)
+    return get_shared_session('MyShop', headers, MyShop_timeout, get_rate_limiter())
+
+
+def parse_page(base_url, current_page_number, sink, session, cache=None, page_data=None):
     """
     Parses all products on the given page
 
     :param base_url: Must be a url in the form of 'https://my-shop.ru/*/page'
     :param current_page_number:
-    :param save_option: Must be a supported save option from 'save_options' dict
-    :param table_name: If saving into sql db, must be a name of an existing table in the database
+    :param sink: Sink of the current parse made by 'open_sink'
+    :param session: requests.Session object of the current session
+    :param cache: DiskCache of products' details
+    :param page_data: Data of the page returned by 'get_page_amount'. The page is downloaded if None
     :return:
     """
 
-    page_url = get_url(base_url, current_page_number)
-    print(page_url)
-    json_data = get_json_data(page_url)
-    for i in range(len(json_data['products'])):
-        row = get_product_info(json_data['products'][i], current_page_number, i)
-        save_row(row, table_name, save_option, myshop_table_structure)
+    json_data = page_data
+    if json_data is None:
+        page_url = get_url(base_url, current_page_number)
+        print(page_url)
+        json_data = get_json_data(page_url, session)
+    save_products(json_data['products'], current_page_number, sink, session, cache)
 
 
-def run_parser(url, save_option):
+def run_parser(url, save_option, concurrency=1, requests_per_second=None, cache_ttl=30 * 24 * 60 * 60,
+               revalidate=False, proxy_pool=None, writer=None, resume=False,
+               incremental=False, per_host=None):
     """
     Main function of the parser. Gets all products information from the given list and saves it according to
     the chosen save option
 
     :param url: Must be a url in the form of 'https://my-shop.ru/*/page'
     :param save_option: Must be a supported save option from 'save_options' dict
+    :param concurrency: Maximum amount of simultaneously fetched pages
+    :param requests_per_second: Maximum amount of page requests per second. Not limited if None
+    :param cache_ttl: Lifetime of cached products' series and ISBN in seconds
+    :param revalidate: If True, pages that have not changed since the previous parse are not parsed and saved.
+    Can only be used with the '.history' save option
+    :param proxy_pool: ProxyPool that gives every fetching thread its own session. If None, the shop's session is
+    used
+    :param writer: RowWriter shared with other parses. A new writer is made if None
+    :param resume: If True, the last unfinished parse of the url is continued from its last saved page into
+    the same table
+    :param incremental: If True, the parse stops once 'incremental_stop_pages' consecutive pages are equal to
+    the previous parse, unless the last full parse is older than 'full_parse_interval'. Meant for lists sorted
+    by newest or by price. Can only be used with the '.history' save option
+    :param per_host: Maximum amount of simultaneous requests to one host. Equal to concurrency if None
     :return:
     """
 
-    table_name = ''
-    if save_option == save_options['.db']:
-        table_name = create_table(myshop_table_structure, 'MyShop')
-
-    page_amount = get_page_amount(url)
-    for i in range(1, page_amount + 1):
-        parse_page(url, i, save_option, table_name)
-
-    input('Нажмите enter для выхода: ')
+    if revalidate:
+        check_partial_parse(save_option, 'revalidate')
+    if incremental:
+        check_partial_parse(save_option, 'incremental')
+    session = get_session(url)
+
+    def fetch(page_url):
+        print(page_url)
+        page_session = session if proxy_pool is None else proxy_pool.get_session()
+        json_data = get_json_data(page_url, page_session, response_cache if revalidate else None)
+        return None if json_data is None else json_data['products']
+
+    with Checkpoint('MyShop', url, resume) as checkpoint, \
+            PageFingerprints('MyShop', url, incremental, incremental_stop_pages, full_parse_interval) as fingerprints, \
+            DiskCache('MyShop_details', cache_ttl) as cache, \
+            DeferredCache(DiskCache('MyShop_responses', 7 * 24 * 60 * 60)) as response_cache, \
+            use_writer(writer) as writer, \
+            fingerprints.attach(writer.attach(open_sink(save_option, myshop_table_structure, 'MyShop',
+                                                        myshop_table_indexes, checkpoint=checkpoint)),
+                                myshop_table_structure) as sink:
+        page_amount, first_page = get_page_amount(url, session)
+        checkpoint.set_page_amount(page_amount)
+        # validators of a page are kept only once its rows are saved
+        checkpoint.on_pages_saved(lambda pages: response_cache.commit(get_url(url, page) for page in pages))
+        seen = get_seen_set(page_amount)
+        urls = checkpoint.get_remaining({i: get_url(url, i) for i in range(1, page_amount + 1)})
+        handle = fingerprints.track(with_checkpoint(
+            lambda i, products: save_products(products, i, sink, session, cache, seen), sink))
+        crawl_pages(urls, fetch, handle, concurrency, requests_per_second=requests_per_second, per_host=per_host,
+                    fetched={1: first_page['products']}, stop=fingerprints.stop)
 
 
 if __name__ == '__main__':
     run_parser(temp_url, save_options['.db'])
+    input('Нажмите enter для выхода: ')
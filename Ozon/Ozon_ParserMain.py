@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
-from core import user_agent_rotator, get_new_headers, get_new_session, save_options, save_row, create_table, \
-    get_str_table_struct
-from settings import Ozon_headers, ozon_table_structure
-from bs4 import BeautifulSoup
-import json
+from core import user_agent_rotator, get_new_headers, get_new_session, save_options, save_row, open_sink, use_writer, \
+    get_str_table_struct, get_number, crawl_pages, get_revalidated, DiskCache, get_rate_limiter, get_attribute_json, \
+    index_state_widgets, Checkpoint, with_checkpoint, PageFingerprints, get_seen_set, DeferredCache, \
+    check_partial_parse, NoDataError
+from settings import Ozon_headers, Ozon_timeout, ozon_table_structure, ozon_table_indexes, incremental_stop_pages, \
+    full_parse_interval
+from urllib.parse import urlsplit
 import re
 # import nordvpn_switcher as ns
 # ns.initialize_VPN(save=1, area_input=['complete rotation'])
@@ -11,25 +13,67 @@ import re
 
 temp_url = 'https://www.ozon.ru/publisher/ayris-press-857416/'
 
+# type of the state widget with the product list
+product_widget_type = 'searchResultsV2'
+# ids of the widgets that held products in a format of {url pattern: widget id}
+product_widget_ids = {}
 
-def get_json_data(url, session):
+
+def get_json_data(url, session, response_cache=None):
     """
     Gets initial json data of the given page
 
     :param url: Must be a correct link to a page with product list or an individual product page on ozon.ru
     :param session: requests.Session object of the current session
-    :return: Page data converted into python structure
+    :param response_cache: DiskCache of pages' validators. If passed, an unchanged page is not parsed
+    :return: Page data converted into python structure. If the page has not changed returns None.
+    NoDataError is raised if the page has no product widget
+    :rtype: dict
+    """
+
+    response = get_revalidated(session, url, response_cache)
+    if response.unchanged:
+        return None
+    return parse_json_data(response.text, url)
+
+
+def get_url_pattern(url):
+    """
+    Gets the pattern of a url. Pages of the same pattern, e.g. all publisher pages, have the same widgets
+
+    :param url: Page url
+    :return: url pattern
+    :rtype: str
+    """
+
+    return urlsplit(url).path.strip('/').split('/')[0]
+
+
+def parse_json_data(response, url=''):
+    """
+    Gets initial json data from the html of a page. The id of the product widget is taken from the pages of
+    the same url pattern. If the page has no such widget, all widgets of the page are indexed at once and the
+    first product widget with products is used and remembered
+
+    :param response: Html of a page with product list
+    :param url: Page url
+    :return: Page data converted into python structure. NoDataError is raised if the page has no product widget
     :rtype: dict
     """
 
-    response = session.get(url=url, timeout=10).text
-    soup = BeautifulSoup(response, 'lxml')
-    json_text = soup.find('div', {'id': 'state-searchResultsV2-312617-default-1'})
-    if not json_text:
-        json_text = soup.find('div', {'id': 'state-searchResultsV2-312864-default-1'})
-    json_text = json_text['data-state']
-    json_data = json.loads(json_text)
-    return json_data
+    url_pattern = get_url_pattern(url)
+    widget_id = product_widget_ids.get(url_pattern)
+    if widget_id is not None:
+        json_data = get_attribute_json(response, widget_id)
+        if json_data is not None and 'items' in json_data:
+            return json_data
+
+    for widget_id in index_state_widgets(response).get(product_widget_type, []):
+        json_data = get_attribute_json(response, widget_id)
+        if json_data is not None and 'items' in json_data:
+            product_widget_ids[url_pattern] = widget_id
+            return json_data
+    raise NoDataError(f'Нет товаров на странице {url}')
 
 
 def get_name(product):
@@ -90,10 +134,12 @@ def get_rating(product):
 
     :param product: Must be a correct json of product information
     :return: rating
-    :rtype: str
+    :rtype: float
     """
 
-    rating = str(product['cellTrackingInfo']['rating'])[:5]
+    rating = get_number(product['cellTrackingInfo']['rating'], float)
+    if rating is not None:
+        rating = round(rating, 3)
     return rating
 
 
@@ -184,18 +230,18 @@ def get_url(base_url, current_page_number):
 
 def get_page_amount(url, session):
     """
-    Gets amount of product pages
+    Gets amount of product pages together with data of the first page, so the page is not downloaded again
 
     :param url: first page url
     :param session: requests.Session object of the current session
-    :return: page amount
-    :rtype: int
+    :return: page amount and data of the first page
+    :rtype: tuple
     """
 
-    response = session.get(url=url, timeout=2).text
+    response = session.get(url=url).text
     page_amount = re.search('''"totalPages":\d+''', response).group()
     page_amount = page_amount[page_amount.find(':') + 1:]
-    return int(page_amount)
+    return int(page_amount), parse_json_data(response, url)
 
 
 def get_product_info(product, current_page_number, product_position):
@@ -226,55 +272,133 @@ def get_product_info(product, current_page_number, product_position):
     return row
 
 
-def parse_page(base_url, current_page_number, save_option, session, table_name=''):
+def save_products(products, current_page_number, sink, seen=None):
+    """
+    Saves all products of a page
+
+    :param products: Must be a correct json of a page's product list. If None, nothing is saved
+    :param current_page_number:
+    :param sink: Sink of the current parse made by 'open_sink'
+    :param seen: Seen set of the parse from 'get_seen_set'. Products seen on earlier pages are skipped
+    :return:
+    """
+
+    if products is None:
+        return
+    for i in range(len(products)):
+        if seen is not None and not seen.add(get_product_code(products[i])):
+            continue
+        row = get_product_info(products[i], current_page_number, i)
+        save_row(row, sink)
+
+
+def get_session(base_url):
+    """
+    Makes the session of the shop for the given product list
+
+    :param base_url: Must be a url in the form of 'https://www.ozon.ru/*/'
+    :return: session with headers and cookies
+    :rtype: requests.Session
+    """
+
+    headers = get_new_headers(Ozon_headers, user_agent_rotator)
+    return get_new_session(url=get_url(base_url, 1), headers=headers, shop_name='Ozon', timeout=Ozon_timeout,
+                           rate_limiter=get_rate_limiter())
+
+
+def parse_page(base_url, current_page_number, sink, session, page_data=None):
     """
-    Parses all products on a given page
+    Parses all products on a given page. NoDataError is raised if the page has no product widget, so the task of
+    the page fails and is retried instead of being completed without rows
 
     :param base_url: Must be a url in the form of 'https://www.ozon.ru/*/'
     :param current_page_number:
-    :param save_option: Must be a supported save option from 'save_options' dict
+    :param sink: Sink of the current parse made by 'open_sink'
     :param session: requests.Session object of the current session
-    :param table_name: If saving into sql db, must be a name of an existing table in the database
+    :param page_data: Data of the page returned by 'get_page_amount'. The page is downloaded if None
     :return:
     """
 
-    page_url = get_url(base_url, current_page_number)
-    print(page_url)
-    json_data = get_json_data(url=page_url, session=session)
-    for i in range(len(json_data['items'])):
-        row = get_product_info(json_data['items'][i], current_page_number, i)
-        save_row(row, table_name, save_option, ozon_table_structure)
+    json_data = page_data
+    if json_data is None:
+        page_url = get_url(base_url, current_page_number)
+        print(page_url)
+        json_data = get_json_data(url=page_url, session=session)
+    save_products(json_data['items'], current_page_number, sink)
 
 
-def run_parser(base_url, save_option):
+def run_parser(base_url, save_option, concurrency=1, requests_per_second=None, revalidate=False, proxy_pool=None,
+               writer=None, resume=False, incremental=False, per_host=None):
     """
     Main function of the parser. Gets all products information from the given list and saves it according to
     the chosen save option
 
     :param base_url: Must be a url in the form of 'https://www.ozon.ru/*/'
     :param save_option: Must be a supported save option from 'save_options' dict
+    :param concurrency: Maximum amount of simultaneously fetched pages
+    :param requests_per_second: Maximum amount of page requests per second. Not limited if None
+    :param revalidate: If True, pages that have not changed since the previous parse are not parsed and saved.
+    Can only be used with the '.history' save option
+    :param proxy_pool: ProxyPool that gives every fetching thread its own session. If None, the shop's session is
+    used
+    :param writer: RowWriter shared with other parses. A new writer is made if None
+    :param resume: If True, the last unfinished parse of the url is continued from its last saved page into
+    the same table
+    :param incremental: If True, the parse stops once 'incremental_stop_pages' consecutive pages are equal to
+    the previous parse, unless the last full parse is older than 'full_parse_interval'. Meant for lists sorted
+    by newest or by price. Can only be used with the '.history' save option
+    :param per_host: Maximum amount of simultaneous requests to one host. Equal to concurrency if None
     :return:
     """
 
+    if revalidate:
+        check_partial_parse(save_option, 'revalidate')
+    if incremental:
+        check_partial_parse(save_option, 'incremental')
     url = get_url(base_url, 1)
-    headers = get_new_headers(Ozon_headers, user_agent_rotator)
-    session = get_new_session(url=url, headers=headers)
-
-    table_name = ''
-    if save_option == save_options['.db']:
-        table_name = create_table(ozon_table_structure, 'Ozon')
-
-    page_amount = get_page_amount(url, session)
-    for i in range(1, page_amount + 1):
-        parse_page(base_url, i, save_option, session, table_name)
-
-    input('Нажмите enter для выхода: ')
+    session = get_session(base_url)
+
+    def fetch(page_url):
+        print(page_url)
+        page_session = session if proxy_pool is None else proxy_pool.get_session()
+        try:
+            json_data = get_json_data(page_url, page_session, response_cache if revalidate else None)
+        except NoDataError as error:
+            # the error is given to the handler, so other pages are still parsed
+            return error
+        return None if json_data is None else json_data['items']
+
+    with Checkpoint('Ozon', base_url, resume) as checkpoint, \
+            PageFingerprints('Ozon', base_url, incremental, incremental_stop_pages,
+                             full_parse_interval) as fingerprints, \
+            DeferredCache(DiskCache('Ozon_responses', 7 * 24 * 60 * 60)) as response_cache, \
+            use_writer(writer) as writer, \
+            fingerprints.attach(writer.attach(open_sink(save_option, ozon_table_structure, 'Ozon', ozon_table_indexes,
+                                                        checkpoint=checkpoint)), ozon_table_structure) as sink:
+        page_amount, first_page = get_page_amount(url, session)
+        checkpoint.set_page_amount(page_amount)
+        # validators of a page are kept only once its rows are saved
+        checkpoint.on_pages_saved(lambda pages: response_cache.commit(get_url(base_url, page) for page in pages))
+        seen = get_seen_set(page_amount)
+        urls = checkpoint.get_remaining({i: get_url(base_url, i) for i in range(1, page_amount + 1)})
+        handle = fingerprints.track(with_checkpoint(lambda i, products: save_products(products, i, sink, seen), sink))
+
+        def handle_page(page_number, products):
+            if isinstance(products, NoDataError):
+                # the page is not completed, so it is parsed again on resume
+                print(f'Ошибка: {get_url(base_url, page_number)}: {products}')
+                checkpoint.fail_page(page_number)
+                return
+            handle(page_number, products)
+
+        crawl_pages(urls, fetch, handle_page, concurrency, requests_per_second=requests_per_second, per_host=per_host,
+                    fetched={1: first_page['items']}, stop=fingerprints.stop)
 
 
 if __name__ == '__main__':
     # run_parser('https://www.ozon.ru/publisher/ayris-press-857416/', save_options['.db'])
     headers = get_new_headers(Ozon_headers, user_agent_rotator)
-    session = get_new_session(temp_url, headers)
+    session = get_new_session(temp_url, headers, timeout=Ozon_timeout)
 
-    response = session.get('https://www.ozon.ru/publisher/ayris-press-857416/', timeout=4).text
+    response = session.get('https://www.ozon.ru/publisher/ayris-press-857416/').text
     print(response)
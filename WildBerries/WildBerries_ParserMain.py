@@ -1,163 +1,307 @@
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
-from requests import get
-from core import space_delete, save_row, save_options, create_table
-from settings import wildberries_table_structure
-
-
-def get_elements(url):
+from lxml import etree
+import lxml.html
+from core import get_number, save_row, save_options, open_sink, use_writer, crawl_pages, get_shared_session, \
+    get_new_headers, user_agent_rotator, get_revalidated, DiskCache, get_rate_limiter, \
+    get_revalidated_text, Checkpoint, with_checkpoint, PageFingerprints, get_seen_set, DeferredCache, \
+    check_partial_parse, NoDataError
+from settings import wildberries_table_structure, wildberries_table_indexes, WildBerries_headers, \
+    WildBerries_timeout, incremental_stop_pages, full_parse_interval
+
+# selectors are compiled once for all pages
+card_xpath = etree.XPath("//a[@class='ref_goods_n_p j-open-full-product-card']")
+goods_count_xpath = etree.XPath("//span[@class='goods-count j-goods-count']")
+# tags of a product card used by the getters in a format of {(tag, class): node name}
+card_nodes = {('ins', 'lower-price'): 'lower_price', ('span', 'lower-price'): 'lower_price_span',
+              ('span', 'price-sale'): 'sale', ('span', 'price-old-block'): 'old_price',
+              ('span', 'c-stars-line-lg'): 'rating', ('span', 'dtList-comments-count'): 'review_amount',
+              ('span', 'goods-name'): 'name', ('strong', 'brand-name'): 'brand', ('img', 'thumbnail'): 'image'}
+
+
+def get_elements(url, session, response_cache=None):
     """
     Gets all products from the given page
 
     :param url: Must be a correct url of a page from a search in the format of 'https://wildberries.ru/*?page=X'
-    :return: Products' information
+    :param session: requests.Session object of the current session
+    :param response_cache: DiskCache of pages' validators. If passed, an unchanged page is not parsed
+    :return: Products' information. If the page has not changed returns None
     :rtype: list
     """
 
-    response = get(url).text
-    soup = BeautifulSoup(response, 'html.parser')
-    elements = soup.find_all('a', class_='ref_goods_n_p j-open-full-product-card')
+    response = get_revalidated(session, url, response_cache)
+    if response.unchanged:
+        return None
+    tree = lxml.html.fromstring(response.text)
+    return find_elements(tree)
+
+
+def find_elements(tree):
+    """
+    Finds all products on a parsed page
+
+    :param tree: lxml tree of a page from a search
+    :return: Products' information. NoDataError is raised if the page is not a product list, e.g. a captcha
+    :rtype: list
+    """
+
+    elements = [get_card_nodes(card) for card in card_xpath(tree)]
+    if not elements and not goods_count_xpath(tree):
+        raise NoDataError('Нет списка товаров на странице')
     return elements
 
 
+def get_card_nodes(card):
+    """
+    Finds all tags of a product card used by the getters in one pass over the card
+
+    :param card: lxml element of a product card
+    :return: Product's information in a format of {node name: lxml element}. The card itself is stored as 'card'
+    :rtype: dict
+    """
+
+    nodes = {'card': card}
+    for node in card.iter():
+        classes = node.get('class')
+        if classes is None:
+            continue
+        for class_name in classes.split():
+            name = card_nodes.get((node.tag, class_name))
+            if name is not None and name not in nodes:
+                nodes[name] = node
+    return nodes
+
+
 def get_lower_price(element):
     """
     Gets a discounted(if on sale) price of a given product
 
-    :param element: Must be a correct BeautifulSoup object of product's information
-    :return: Price in a format convertible into int
-    :rtype: str
+    :param element: Product's information from 'get_elements'
+    :return: Price
+    :rtype: int
     """
 
-    price = element.find('ins', class_='lower-price')
+    price = element.get('lower_price')
     if price is None:
-        price = element.find('span', class_='lower-price')
-    price = space_delete(price.text)
-    price = price.split()
-    price = ''.join(price[:len(price)-1])
-    return price
+        price = element['lower_price_span']
+    return get_number(price.text_content())
 
 
 def get_sale_percentage(element):
     """
     Gets sale percentage(if on sale) of the given product
 
-    :param element: Must be a correct BeautifulSoup object of product's information
-    :return: Sale percentage in a format convertible into int
-    :rtype: str
+    :param element: Product's information from 'get_elements'
+    :return: Sale percentage
+    :rtype: int
     """
 
-    sale = element.find('span', class_='price-sale active')
-    if sale is None:
-        return '0'
-    sale = space_delete(sale.text)
-    return sale[1:len(sale)-1]
+    sale = element.get('sale')
+    if sale is None or 'active' not in sale.get('class').split():
+        return 0
+    return get_number(sale.text_content())
 
 
 def get_non_sale_price(element):
     """
     Gets product's price before sale if one is in effect. Otherwise returns current price
 
-    :param element: Must be a correct BeautifulSoup object of product's information
-    :return: Price in a format convertible into int
-    :rtype: str
+    :param element: Product's information from 'get_elements'
+    :return: Price
+    :rtype: int
     """
 
-    non_sale_price = element.find('span', class_='price-old-block')
+    non_sale_price = element.get('old_price')
     if non_sale_price is None:
-        non_sale_price = get_lower_price(element)
-    else:
-        non_sale_price = space_delete(non_sale_price.find('del').text)
-        non_sale_price = non_sale_price.split()
-        non_sale_price = ''.join(non_sale_price[:len(non_sale_price)-1])
-    return non_sale_price
+        return get_lower_price(element)
+    return get_number(non_sale_price.find('.//del').text_content())
 
 
 def get_rating(element):
     """
     Gets given product's rating
 
-    :param element: Must be a correct BeautifulSoup object of product's information
-    :return: Product's rating. If there is no rating returns 'Нет'
-    :rtype: str
+    :param element: Product's information from 'get_elements'
+    :return: Product's rating. If there is no rating returns None
+    :rtype: float
     """
 
-    rating = element.find('span', class_='c-stars-line-lg')
+    rating = element.get('rating')
     if rating is None:
-        return 'Нет'
-    return rating['class'][-1][-1]
+        return None
+    return get_number(rating.get('class').split()[-1][-1], float)
 
 
 def get_review_amount(element):
     """
     Gets amount of reviews of a given product
 
-    :param element: Must be a correct BeautifulSoup object of product's information
-    :return: Amount of reviews ina format convertible into int
-    :rtype: str
+    :param element: Product's information from 'get_elements'
+    :return: Amount of reviews
+    :rtype: int
     """
 
-    review_amount = element.find('span', class_='dtList-comments-count')
+    review_amount = element.get('review_amount')
     if review_amount is None:
-        return '0'
-    return review_amount.text
+        return 0
+    return get_number(review_amount.text_content())
 
 
 def get_article(element):
     """
     Gets article of a given product
 
-    :param element: Must be a correct BeautifulSoup object of product's information
+    :param element: Product's information from 'get_elements'
     :return: Article
     :rtype: str
     """
 
-    article = element['href'].split('/')[2]
+    article = element['card'].get('href').split('/')[2]
     return article
 
 
-def get_page_amount(url):
+def get_page_amount(url, session):
     """
-    Gets amount of pages of the product list
+    Gets amount of pages of the product list together with products of the given page, so the page is not
+    downloaded again
 
     :param url: Must be a url in the form of 'https://wildberries.ru/*?page=X'
-    :return: Page amount
-    :rtype: int
+    :param session: requests.Session object of the current session
+    :return: Page amount and products' information of the page
+    :rtype: tuple
     """
 
-    response = get(url).text
-    soup = BeautifulSoup(response, 'html.parser')
-    count = soup.find('span', class_='goods-count j-goods-count').text[5:]
+    response = session.get(url).text
+    tree = lxml.html.fromstring(response)
+    count = goods_count_xpath(tree)[0].text_content()[5:]
     count = count.split()
     count = int(''.join(count[:len(count)-1]))
-    if count % 100 == 0:
-        return count // 100
-    return (count // 100) + 1
+    page_amount = count // 100
+    if count % 100 != 0:
+        page_amount += 1
+    return page_amount, find_elements(tree)
 
 
-def get_name(url):
+def get_name(url, session):
     """
     Gets name of a given product
 
     :param url: Must be correct url of an individual product's page
+    :param session: requests.Session object of the current session
     :return: Name
     :rtype: str
     """
 
-    response = get(url).text
+    response = session.get(url).text
     soup = BeautifulSoup(response, 'html.parser')
     name = soup.find('span', class_='name').text
     return name
 
 
+def get_product_url(article):
+    """
+    Makes a url of an individual product's page
+
+    :param article: Article of the product
+    :return: product url
+    :rtype: str
+    """
+
+    return f'https://www.wildberries.ru/catalog/{article}/detail.aspx'
+
+
+def get_listing_name(element):
+    """
+    Gets name of a given product from the product list
+
+    :param element: Product's information from 'get_elements'
+    :return: Name. If the product list has no name of the product returns None
+    :rtype: str
+    """
+
+    name = element.get('name')
+    if name is None or not name.text_content().strip():
+        return None
+    return name.text_content().strip()
+
+
+def get_card_details(articles, session):
+    """
+    Gets card details of the given products with one request to the card api of wildberries.ru
+
+    :param articles: Articles of the products
+    :param session: requests.Session object of the current session
+    :return: Card details in a format of {article: details}
+    :rtype: dict
+    """
+
+    url = f"https://card.wb.ru/cards/detail?appType=1&curr=rub&dest=-1257786&nm={';'.join(articles)}"
+    json_data = session.get(url).json()
+    return {str(product['id']): product for product in json_data['data']['products']}
+
+
+def get_names(elements, session, name_source='listing', workers=8):
+    """
+    Gets names of all products of a page. Names that can not be found in the chosen source are fetched
+    from individual products' pages concurrently
+
+    :param elements: Products' information from 'get_elements'
+    :param session: requests.Session object of the current session
+    :param name_source: 'listing' to take names from the product list, 'cards' to take them from the card api
+    or 'detail' to always fetch individual products' pages
+    :param workers: Maximum amount of simultaneously fetched products' pages
+    :return: Names in a format of {article: name}
+    :rtype: dict
+    """
+
+    listing_names = {get_article(element): get_listing_name(element) for element in elements}
+    return get_article_names(listing_names, session, name_source, workers)
+
+
+def get_article_names(listing_names, session, name_source='listing', workers=8):
+    """
+    Gets names of the given products like 'get_names' does
+
+    :param listing_names: Names from the product list in a format of {article: name}. Names can be None.
+    Used only by 'listing' source
+    :param session: requests.Session object of the current session
+    :param name_source: 'listing', 'cards' or 'detail', like in 'get_names'
+    :param workers: Maximum amount of simultaneously fetched products' pages
+    :return: Names in a format of {article: name}
+    :rtype: dict
+    """
+
+    articles = list(listing_names)
+    names = {}
+    if name_source == 'listing':
+        names = dict(listing_names)
+    elif name_source == 'cards':
+        try:
+            card_details = get_card_details(articles, session)
+        except Exception:
+            card_details = {}
+        names = {article: card_details.get(article, {}).get('name') for article in articles}
+
+    missing_articles = [article for article in articles if not names.get(article)]
+    if missing_articles:
+        with ThreadPoolExecutor(workers) as executor:
+            product_urls = [get_product_url(article) for article in missing_articles]
+            missing_names = executor.map(get_name, product_urls, [session] * len(product_urls))
+            for article, name in zip(missing_articles, missing_names):
+                names[article] = name
+    return names
+
+
 def get_brand(element):
     """
     Gets brand of a given product
-    :param element: Must be a correct BeautifulSoup object of product's information
+    :param element: Product's information from 'get_elements'
     :return: Brand
     :rtype: str
     """
 
-    brand = element.find('strong', class_='brand-name').text.split('/')[0]
+    brand = element['brand'].text_content().split('/')[0]
     return brand[:len(brand)-1]
 
 
@@ -165,22 +309,23 @@ def get_image_src(element):
     """
     Gets thumbnail link of a given product
 
-    :param element: Must be a correct BeautifulSoup object of product's information
+    :param element: Product's information from 'get_elements'
     :return: Link to product's thumbnail
     :rtype: str
     """
 
-    image_src = element.find('img', class_='thumbnail')['src']
+    image_src = element['image'].get('src')
     return 'https:' + image_src
 
 
-def get_product_info(element, current_page_number, product_position):
+def get_product_info(element, current_page_number, product_position, name):
     """
     Gets all required information on a given product
 
-    :param element: Must be a correct BeautifulSoup object of product's information
+    :param element: Product's information from 'get_elements'
     :param current_page_number:
     :param product_position: Position of the given product on the page. Indexes start from 0
+    :param name: Name of the product from 'get_names'
     :return: Product information in the same order as in database
     :rtype: tuple
     """
@@ -194,56 +339,204 @@ def get_product_info(element, current_page_number, product_position):
     article = get_article(element)
     popularity = product_position + 1 + 100 * (current_page_number - 1)
     image_src = get_image_src(element)
-    product_url = f'https://www.wildberries.ru/catalog/{article}/detail.aspx'
-    name = get_name(product_url)
     row = (brand, name, non_sale_price, sale_percentage, lower_price, popularity, rating, review_amount,
            image_src, article)
     return row
 
 
-def parse_page(base_url, current_page_number, save_option, table_name=''):
+def get_url(base_url, current_page_number):
     """
-    Parses all products on the given page
+    Makes a concrete page url from base url and page number
 
     :param base_url: Must be a url in the form of 'https://wildberries.ru/*'
     :param current_page_number:
-    :param save_option: Must be a supported save option from 'save_options' dict
-    :param table_name: If saving into sql db, must be a name of an existing table in the database
-    :return:
+    :return: page url
+    :rtype: str
     """
 
     if base_url.find('?') == -1:
         base_url += '?'
     else:
         base_url += '&'
-    url = f'{base_url}page={current_page_number}'
-    print(url)
-    elements = get_elements(url)
-    for i in range(len(elements)):
-        row = get_product_info(elements[i], current_page_number, i)
-        save_row(row, table_name, save_option, wildberries_table_structure)
+    return f'{base_url}page={current_page_number}'
 
 
-def run_parser(url, save_option):
+def get_rows(elements, current_page_number):
+    """
+    Gets information on all products of a page with names from the product list
+
+    :param elements: Products' information from 'get_elements'
+    :param current_page_number:
+    :return: Products' information in the same order as in database. Names missing in the product list are None
+    :rtype: list
+    """
+
+    return [get_product_info(element, current_page_number, i, get_listing_name(element))
+            for i, element in enumerate(elements)]
+
+
+def extract_rows(page, current_page_number):
+    """
+    Gets information on all products from html of a page. Used by parsing processes of 'crawl_pages'
+
+    :param page: Html of a page from a search
+    :param current_page_number:
+    :return: Products' information in the format of 'get_rows'
+    :rtype: list
+    """
+
+    return get_rows(find_elements(lxml.html.fromstring(page)), current_page_number)
+
+
+def save_rows(rows, sink, session, name_source='listing', seen=None):
+    """
+    Saves rows made by 'get_rows'. Names are taken from the chosen source
+
+    :param rows: Products' information from 'get_rows'. If None, nothing is saved
+    :param sink: Sink of the current parse made by 'open_sink'
+    :param session: requests.Session object of the current session
+    :param name_source: Source of products' names, one of the sources of 'get_names'
+    :param seen: Seen set of the parse from 'get_seen_set'. Products seen on earlier pages are skipped before
+    their names are fetched
+    :return:
+    """
+
+    if rows is None:
+        return
+    if seen is not None:
+        rows = [row for row in rows if seen.add(row[-1])]
+    listing_names = {row[-1]: row[1] for row in rows}
+    names = get_article_names(listing_names, session, name_source)
+    for row in rows:
+        save_row((row[0], names[row[-1]]) + row[2:], sink)
+
+
+def save_products(elements, current_page_number, sink, session, name_source='listing', seen=None):
+    """
+    Saves all products of a page
+
+    :param elements: Products' information from 'get_elements'. If None, nothing is saved
+    :param current_page_number:
+    :param sink: Sink of the current parse made by 'open_sink'
+    :param session: requests.Session object of the current session
+    :param name_source: Source of products' names, one of the sources of 'get_names'
+    :param seen: Seen set of the parse from 'get_seen_set'. Products seen on earlier pages are skipped before
+    their names are fetched
+    :return:
+    """
+
+    if elements is None:
+        return
+    # positions of skipped products are kept, so the rest keep their ranks
+    positions = [i for i in range(len(elements)) if seen is None or seen.add(get_article(elements[i]))]
+    names = get_names([elements[i] for i in positions], session, name_source)
+    for i in positions:
+        row = get_product_info(elements[i], current_page_number, i, names[get_article(elements[i])])
+        save_row(row, sink)
+
+
+def get_session(base_url):
+    """
+    Makes the session of the shop for the given product list
+
+    :param base_url: Must be a url in the form of 'https://wildberries.ru/*'
+    :return: session
+    :rtype: ParserSession
+    """
+
+    headers = get_new_headers(WildBerries_headers, user_agent_rotator)
+    return get_shared_session('WildBerries', headers, WildBerries_timeout, get_rate_limiter())
+
+
+def parse_page(base_url, current_page_number, sink, session, name_source='listing', page_data=None):
+    """
+    Parses all products on the given page
+
+    :param base_url: Must be a url in the form of 'https://wildberries.ru/*'
+    :param current_page_number:
+    :param sink: Sink of the current parse made by 'open_sink'
+    :param session: requests.Session object of the current session
+    :param name_source: Source of products' names, one of the sources of 'get_names'
+    :param page_data: Data of the page returned by 'get_page_amount'. The page is downloaded if None
+    :return:
+    """
+
+    elements = page_data
+    if elements is None:
+        url = get_url(base_url, current_page_number)
+        print(url)
+        elements = get_elements(url, session)
+    save_products(elements, current_page_number, sink, session, name_source)
+
+
+def run_parser(url, save_option, concurrency=1, requests_per_second=None, name_source='listing', revalidate=False,
+               proxy_pool=None, parse_processes=0, writer=None, resume=False,
+               incremental=False, per_host=None):
     """
     Main function of the parser. Gets all products information from the given list and saves it according to
     the chosen save option
 
     :param url: Must be a url in the form of 'https://wildberries.ru/*'
     :param save_option: Must be a supported save option from 'save_options' dict
+    :param concurrency: Maximum amount of simultaneously fetched pages
+    :param requests_per_second: Maximum amount of page requests per second. Not limited if None
+    :param name_source: Source of products' names, one of the sources of 'get_names'
+    :param revalidate: If True, pages that have not changed since the previous parse are not parsed and saved.
+    Can only be used with the '.history' save option
+    :param proxy_pool: ProxyPool that gives every fetching thread its own session. If None, the shop's session is
+    used
+    :param parse_processes: Amount of processes that extract products from pages. If 0, products are extracted
+    in the fetching threads
+    :param writer: RowWriter shared with other parses. A new writer is made if None
+    :param resume: If True, the last unfinished parse of the url is continued from its last saved page into
+    the same table
+    :param incremental: If True, the parse stops once 'incremental_stop_pages' consecutive pages are equal to
+    the previous parse, unless the last full parse is older than 'full_parse_interval'. Meant for lists sorted
+    by newest or by price. Can only be used with the '.history' save option
+    :param per_host: Maximum amount of simultaneous requests to one host. Equal to concurrency if None
     :return:
     """
 
-    table_name = ''
-    if save_option == save_options['.db']:
-        table_name = create_table(wildberries_table_structure, 'WildBerries')
-
-    page_amount = get_page_amount(url)
-    for i in range(1, page_amount + 1):
-        parse_page(url, i, save_option, table_name)
-
-    input('Нажмите enter для выхода: ')
+    if revalidate:
+        check_partial_parse(save_option, 'revalidate')
+    if incremental:
+        check_partial_parse(save_option, 'incremental')
+    session = get_session(url)
+
+    def fetch(page_url):
+        print(page_url)
+        page_session = session if proxy_pool is None else proxy_pool.get_session()
+        if parse_processes:
+            return get_revalidated_text(page_session, page_url, response_cache if revalidate else None)
+        return get_elements(page_url, page_session, response_cache if revalidate else None)
+
+    with Checkpoint('WildBerries', url, resume) as checkpoint, \
+            PageFingerprints('WildBerries', url, incremental, incremental_stop_pages,
+                             full_parse_interval) as fingerprints, \
+            DeferredCache(DiskCache('WildBerries_responses', 7 * 24 * 60 * 60)) as response_cache, \
+            use_writer(writer) as writer, \
+            fingerprints.attach(writer.attach(open_sink(save_option, wildberries_table_structure, 'WildBerries',
+                                                        wildberries_table_indexes, checkpoint=checkpoint)),
+                                wildberries_table_structure) as sink:
+        page_amount, first_page = get_page_amount(get_url(url, 1), session)
+        checkpoint.set_page_amount(page_amount)
+        # validators of a page are kept only once its rows are saved
+        checkpoint.on_pages_saved(lambda pages: response_cache.commit(get_url(url, page) for page in pages))
+        seen = get_seen_set(page_amount)
+        urls = checkpoint.get_remaining({i: get_url(url, i) for i in range(1, page_amount + 1)})
+        if parse_processes:
+            handle = fingerprints.track(with_checkpoint(
+                lambda i, rows: save_rows(rows, sink, session, name_source, seen), sink))
+            crawl_pages(urls, fetch, handle, concurrency, requests_per_second=requests_per_second, per_host=per_host,
+                        fetched={1: get_rows(first_page, 1)}, parse=extract_rows, processes=parse_processes,
+                        stop=fingerprints.stop)
+        else:
+            handle = fingerprints.track(with_checkpoint(
+                lambda i, elements: save_products(elements, i, sink, session, name_source, seen), sink))
+            crawl_pages(urls, fetch, handle, concurrency, requests_per_second=requests_per_second, per_host=per_host,
+                        fetched={1: first_page}, stop=fingerprints.stop)
 
 
 if __name__ == '__main__':
     run_parser('https://www.wildberries.ru/brands/ayris-press', save_options['.db'])
+    input('Нажмите enter для выхода: ')
@@ -1,5 +1,20 @@
-from .degub_functions import write_dict
-from .formatting_functions import space_delete, get_str_table_struct, get_new_headers
-from .save_functions import save_row, save_options, create_table
-from .constants import return_codes, user_agent_rotator
-from .session_functions import get_new_session
+from .degub_functions import write_dict, benchmark, benchmark_parse, benchmark_listing_extraction
+from .formatting_functions import space_delete, get_str_table_struct, get_str_index_queries, get_number, \
+    get_new_headers
+from .save_functions import save_row, save_rows, save_options, create_table, open_sink, get_key_index, \
+    check_partial_parse
+from .constants import return_codes, user_agent_rotator, database_path, results_directory, cache_path, \
+    rate_limits_path, queue_path
+from .session_functions import get_new_session, get_shared_session, make_session, ParserSession, get_revalidated, \
+    ProxyPool, solve_challenge, save_session_state, load_session_state, get_revalidated_text
+from .writer_functions import RowWriter, WriterError, use_writer
+from .crawl_functions import crawl_pages, parse_pages
+from .cache_functions import DiskCache, DeferredCache
+from .limiter_functions import AdaptiveRateLimiter, get_rate_limiter
+from .extraction_functions import get_attribute_json, get_script_json, iter_script_json, index_state_widgets, \
+    NoDataError
+from .checkpoint_functions import Checkpoint, with_checkpoint
+from .incremental_functions import PageFingerprints
+from .queue_functions import TaskQueue, SqliteTaskQueue, work
+from .dedup_functions import SeenSet, BloomFilter, get_seen_set
+from .analytics_functions import get_price_report, export_report
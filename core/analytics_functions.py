@@ -0,0 +1,206 @@
+from datetime import datetime
+import csv
+import sqlite3
+from .constants import database_path, table_date_format
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# separator of text values in a chunk. Can not appear in product codes
+key_separator = '\x1f'
+
+# possible names of the columns used in reports. The first existing column is used
+key_columns = ('[Код товара на сайте]', 'Артикул')
+price_columns = ('Итого',)
+discount_columns = ('Скидка',)
+popularity_columns = ('Популярность', '[Популярность рейтинг]')
+
+report_columns = ('Код', 'Цена до', 'Цена после', 'Изменение цены', 'Скидка до', 'Скидка после',
+                  'Популярность до', 'Популярность после', 'Изменение популярности')
+
+
+def get_snapshot_tables(connection, shop_name):
+    """
+    Gets names of the tables made by 'create_table' for the given shop, from the oldest to the newest.
+    Tables of runs that are not finished are skipped, so products a crashed parse did not reach are not reported
+    as removed
+
+    :param connection: Connection to the sqlite3 database
+    :param shop_name: Name of the target shop
+    :return: table names
+    :rtype: list
+    """
+
+    unfinished = set()
+    # tables made before checkpoints were added and tables of task queue workers have no runs
+    if connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'crawl_runs'").fetchone():
+        unfinished = {table_name for (table_name,) in connection.execute(
+            'SELECT table_name FROM crawl_runs WHERE finished IS NULL AND table_name IS NOT NULL')}
+    tables = []
+    for (table_name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'"):
+        if not table_name.startswith(f'{shop_name}_') or table_name in unfinished:
+            continue
+        parts = table_name[len(shop_name) + 1:].split('_')
+        try:
+            if len(parts) == 7:
+                date = datetime.strptime('_'.join(parts[:6]), table_date_format)
+            else:
+                # tables made before run ids were added have no seconds
+                date = datetime.strptime('_'.join(parts), '%d_%m_%Y_%H_%M')
+        except ValueError:
+            continue
+        tables.append((date, table_name))
+    return [table_name for date, table_name in sorted(tables)]
+
+
+def find_column(columns, names):
+    """
+    Gets the first of the given column names that exists in the table
+
+    :param columns: Column names of the table
+    :param names: Possible column names
+    :return: column name in sql format
+    :rtype: str
+    """
+
+    for name in names:
+        if name.strip('[]') in columns:
+            return f'[{name.strip("[]")}]'
+    raise KeyError(f'None of the columns {names} found')
+
+
+def load_snapshot(connection, table_name, chunk_size=100000):
+    """
+    Loads codes, prices, discounts and popularity of all products of a snapshot into numpy arrays.
+    Every chunk is fetched from sqlite as a few concatenated strings that are converted by numpy,
+    so no python tuple is made for a row
+
+    :param connection: Connection to the sqlite3 database
+    :param table_name: Name of a table made by 'create_table'
+    :param chunk_size: Amount of rows in a chunk
+    :return: arrays 'code', 'price', 'discount' and 'popularity' sorted by code. Every code is present once
+    :rtype: dict
+    """
+
+    if np is None:
+        raise ImportError('numpy package is required for price reports')
+    columns = [column[1] for column in connection.execute(f'PRAGMA table_info({table_name})')]
+    key = find_column(columns, key_columns)
+    values = [find_column(columns, names) for names in (price_columns, discount_columns, popularity_columns)]
+    str_values = ', '.join(f"group_concat(ifnull(CAST({value} AS REAL), 'nan'), ',')" for value in values)
+    query = f"""SELECT group_concat({key}, '{key_separator}'), {str_values}, max(rowid)
+                FROM (SELECT rowid, * FROM {table_name} WHERE rowid > ? ORDER BY rowid LIMIT ?)"""
+
+    chunks = {'code': [], 'price': [], 'discount': [], 'popularity': []}
+    last_rowid = 0
+    while True:
+        chunk = connection.execute(query, (last_rowid, chunk_size)).fetchone()
+        codes, prices, discounts, popularity, last_rowid = chunk
+        if last_rowid is None:
+            break
+        chunks['code'].append(np.array(codes.split(key_separator)))
+        chunks['price'].append(np.fromstring(prices, sep=','))
+        chunks['discount'].append(np.fromstring(discounts, sep=','))
+        chunks['popularity'].append(np.fromstring(popularity, sep=','))
+
+    snapshot = {name: np.concatenate(chunk) if chunk else np.array([], dtype=float)
+                for name, chunk in chunks.items()}
+    if not chunks['code']:
+        snapshot['code'] = np.array([], dtype=str)
+    # tables of older parses and of task queue workers can hold a product twice. Rows are loaded by rowid,
+    # so the first row of a code is kept, it has the best rank
+    codes, first_rows = np.unique(snapshot['code'], return_index=True)
+    return {name: array[first_rows] for name, array in snapshot.items()}
+
+
+def get_changed(old, new):
+    """
+    Compares two arrays of values. Missing values are stored as nan and nan != nan, so they are compared separately
+
+    :param old: Old values
+    :param new: New values
+    :return: mask of changed values
+    :rtype: numpy.ndarray
+    """
+
+    return (old != new) & ~(np.isnan(old) & np.isnan(new))
+
+
+def compare_snapshots(old, new):
+    """
+    Compares two snapshots loaded by 'load_snapshot'
+
+    :param old: Older snapshot
+    :param new: Newer snapshot
+    :return: 'new' and 'removed' product codes and arrays of report_columns for products whose price,
+    discount or popularity changed
+    :rtype: dict
+    """
+
+    codes, old_indexes, new_indexes = np.intersect1d(old['code'], new['code'], assume_unique=True,
+                                                     return_indices=True)
+    old_price, new_price = old['price'][old_indexes], new['price'][new_indexes]
+    old_discount, new_discount = old['discount'][old_indexes], new['discount'][new_indexes]
+    old_popularity, new_popularity = old['popularity'][old_indexes], new['popularity'][new_indexes]
+    price_delta = new_price - old_price
+    popularity_delta = old_popularity - new_popularity
+
+    changed = get_changed(old_price, new_price) | get_changed(old_discount, new_discount) | \
+        get_changed(old_popularity, new_popularity)
+    changes = (codes, old_price, new_price, price_delta, old_discount, new_discount, old_popularity,
+               new_popularity, popularity_delta)
+    report = {name: array[changed] for name, array in zip(report_columns, changes)}
+    report['new'] = np.setdiff1d(new['code'], old['code'], assume_unique=True)
+    report['removed'] = np.setdiff1d(old['code'], new['code'], assume_unique=True)
+    return report
+
+
+def get_price_report(shop_name, table_names=None, db_path=database_path, chunk_size=100000):
+    """
+    Compares every pair of consecutive snapshots of the given shop
+
+    :param shop_name: Name of the target shop
+    :param table_names: Names of the compared tables. If not passed, all snapshots of the shop are compared
+    :param db_path: Path to the sqlite3 database file
+    :param chunk_size: Amount of rows loaded from sqlite at once
+    :return: reports made by 'compare_snapshots' in a format of (old table name, new table name, report)
+    :rtype: list
+    """
+
+    connection = sqlite3.connect(db_path)
+    try:
+        if table_names is None:
+            table_names = get_snapshot_tables(connection, shop_name)
+        reports = []
+        old = None
+        for i, table_name in enumerate(table_names):
+            new = load_snapshot(connection, table_name, chunk_size)
+            if old is not None:
+                reports.append((table_names[i - 1], table_name, compare_snapshots(old, new)))
+            old = new
+        return reports
+    finally:
+        connection.close()
+
+
+def export_report(reports, path):
+    """
+    Saves reports made by 'get_price_report' into a csv file
+
+    :param reports: Reports in a format of (old table name, new table name, report)
+    :param path: Path to the csv file
+    :return:
+    """
+
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(('Было', 'Стало', 'Изменение') + report_columns)
+        for old_table, new_table, report in reports:
+            columns = [report[name].tolist() for name in report_columns]
+            for row in zip(*columns):
+                writer.writerow((old_table, new_table, 'Изменён') + row)
+            for code in report['new'].tolist():
+                writer.writerow((old_table, new_table, 'Новый', code))
+            for code in report['removed'].tolist():
+                writer.writerow((old_table, new_table, 'Удалён', code))
@@ -0,0 +1,157 @@
+import json
+import sqlite3
+import threading
+import time
+from .constants import cache_path
+
+
+class DiskCache:
+    """
+    Key-value cache stored in a sqlite3 database. Entries expire after ttl seconds and the least recently used
+    entries are removed once there are more than max_entries of them
+    """
+
+    def __init__(self, name, ttl=30 * 24 * 60 * 60, max_entries=1000000, db_path=cache_path):
+        """
+        Opens the cache and makes its table if it does not exist
+
+        :param name: Name of the cache table
+        :param ttl: Lifetime of an entry in seconds. Entries never expire if None
+        :param max_entries: Maximum amount of entries
+        :param db_path: Path to the sqlite3 database file of the cache
+        """
+
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.set_count = 0
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS {name} (key TEXT PRIMARY KEY, value TEXT, '
+                                    f'created REAL, accessed REAL)')
+            self.connection.execute(f'CREATE INDEX IF NOT EXISTS {name}_accessed ON {name} (accessed)')
+        self.remove_expired()
+
+    def get(self, key, default=None):
+        """
+        Gets a value from the cache
+
+        :param key: Key of the entry
+        :param default: Returned if there is no such entry or it has expired
+        :return: value
+        """
+
+        now = time.time()
+        with self.lock:
+            entry = self.connection.execute(f'SELECT value, created FROM {self.name} WHERE key = ?',
+                                            (str(key),)).fetchone()
+            if entry is None or (self.ttl is not None and entry[1] + self.ttl < now):
+                return default
+            with self.connection:
+                self.connection.execute(f'UPDATE {self.name} SET accessed = ? WHERE key = ?', (now, str(key)))
+        return json.loads(entry[0])
+
+    def set(self, key, value):
+        """
+        Saves a value into the cache. The value must be convertible into json
+
+        :param key: Key of the entry
+        :param value: Value of the entry
+        :return:
+        """
+
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(f'INSERT or REPLACE INTO {self.name} VALUES (?, ?, ?, ?)',
+                                    (str(key), json.dumps(value, ensure_ascii=False), now, now))
+            self.set_count += 1
+        if self.set_count % 1000 == 0:
+            self.remove_expired()
+
+    def remove_expired(self):
+        """
+        Removes expired entries and the least recently used entries above max_entries
+
+        :return:
+        """
+
+        with self.lock, self.connection:
+            if self.ttl is not None:
+                self.connection.execute(f'DELETE FROM {self.name} WHERE created < ?', (time.time() - self.ttl,))
+            self.connection.execute(f'DELETE FROM {self.name} WHERE key IN (SELECT key FROM {self.name} '
+                                    f'ORDER BY accessed DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def close(self):
+        """
+        Applies max_entries and closes the cache
+
+        :return:
+        """
+
+        if self.connection is None:
+            return
+        self.remove_expired()
+        self.connection.close()
+        self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class DeferredCache:
+    """
+    Cache wrapper that keeps new values in memory until they are committed. Used for validators of pages,
+    so a page is taken as unchanged only after its rows are saved
+    """
+
+    def __init__(self, cache):
+        """
+        :param cache: DiskCache that gets committed values. Closed together with the wrapper
+        """
+
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def get(self, key, default=None):
+        return self.cache.get(key, default)
+
+    def set(self, key, value):
+        with self.lock:
+            self.pending[str(key)] = value
+
+    def commit(self, keys):
+        """
+        Saves values set for the keys into the cache. Keys without a set value are skipped
+
+        :param keys: Keys of the entries
+        :return:
+        """
+
+        for key in keys:
+            with self.lock:
+                if str(key) not in self.pending:
+                    continue
+                value = self.pending.pop(str(key))
+            self.cache.set(key, value)
+
+    def close(self):
+        """
+        Drops values that were not committed and closes the cache
+
+        :return:
+        """
+
+        self.pending = {}
+        self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,194 @@
+from datetime import datetime
+import sqlite3
+from .constants import database_path
+
+
+class Checkpoint:
+    """
+    Progress of a parse stored in the database of its sink: the run, its table and completed pages.
+    Completed pages are written by the sink in the same transaction as their rows, so after a crash
+    the saved progress matches the saved rows
+    """
+
+    def __init__(self, shop_name, url, resume=False, db_path=database_path):
+        """
+        Starts a new run or continues the last unfinished run of the same shop and url
+
+        :param shop_name: Name of the target shop
+        :param url: Url of the product list
+        :param resume: If True, the last unfinished run is continued. A new run is started if there is none
+        :param db_path: Path to the sqlite3 database file. Must be the database of the sink
+        """
+
+        self.shop_name = shop_name
+        self.url = url
+        self.run_id = None
+        self.table_name = None
+        self.page_amount = None
+        self.completed_pages = set()
+        self.failed_pages = set()
+        self.saved_hooks = []
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        create_checkpoint_tables(self.connection)
+        if resume:
+            run = self.connection.execute('SELECT run_id, table_name, page_amount FROM crawl_runs WHERE shop = ? '
+                                          'AND url = ? AND finished IS NULL AND table_name IS NOT NULL '
+                                          'ORDER BY run_id DESC LIMIT 1', (shop_name, url)).fetchone()
+            if run is not None:
+                self.run_id, self.table_name, self.page_amount = run
+                self.completed_pages = {page for (page,) in self.connection.execute(
+                    'SELECT page FROM crawl_checkpoints WHERE run_id = ?', (self.run_id,))}
+                print(f'Продолжение {self.table_name}: готово {len(self.completed_pages)} страниц')
+        if self.run_id is None:
+            with self.connection:
+                self.run_id = self.connection.execute(
+                    'INSERT INTO crawl_runs (shop, url, started) VALUES (?, ?, ?)',
+                    (shop_name, url, datetime.today().isoformat(timespec='seconds'))).lastrowid
+
+    @property
+    def resumed(self):
+        return self.table_name is not None
+
+    def start(self, table_name):
+        """
+        Records the table of a new run. Called by the sink once its table is made
+
+        :param table_name: Name of the table of the sink
+        :return:
+        """
+
+        self.table_name = table_name
+        with self.connection:
+            self.connection.execute('UPDATE crawl_runs SET table_name = ? WHERE run_id = ?',
+                                    (table_name, self.run_id))
+
+    def set_page_amount(self, page_amount):
+        """
+        Records the amount of pages of the product list
+
+        :param page_amount: Amount of pages
+        :return:
+        """
+
+        self.page_amount = page_amount
+        with self.connection:
+            self.connection.execute('UPDATE crawl_runs SET page_amount = ? WHERE run_id = ?',
+                                    (page_amount, self.run_id))
+
+    def get_remaining(self, urls):
+        """
+        Removes completed pages from the given pages
+
+        :param urls: Page urls in a format of {page number: url}
+        :return: urls of pages that are not completed
+        :rtype: dict
+        """
+
+        return {page: url for page, url in urls.items() if page not in self.completed_pages}
+
+    def save_pages(self, connection, pages):
+        """
+        Records completed pages. Called by the sink inside the transaction that writes the rows of the pages
+
+        :param connection: Connection of the sink with an open transaction
+        :param pages: Numbers of completed pages
+        :return:
+        """
+
+        connection.executemany('INSERT OR IGNORE INTO crawl_checkpoints VALUES (?, ?)',
+                               [(self.run_id, page) for page in pages])
+
+    def on_pages_saved(self, hook):
+        """
+        Registers a function that is called once rows of completed pages are committed
+
+        :param hook: Function that gets numbers of the saved pages
+        :return:
+        """
+
+        self.saved_hooks.append(hook)
+
+    def commit_pages(self, pages):
+        """
+        Marks pages as saved. Called by the sink after the transaction that wrote the rows of the pages
+
+        :param pages: Numbers of completed pages
+        :return:
+        """
+
+        self.completed_pages.update(pages)
+        for hook in self.saved_hooks:
+            hook(pages)
+
+    def fail_page(self, page_number):
+        """
+        Records a page that could not be parsed, e.g. a page without data. The run is not finished then,
+        so the page is parsed again on resume
+
+        :param page_number: Number of the page
+        :return:
+        """
+
+        self.failed_pages.add(page_number)
+
+    def finish(self):
+        """
+        Marks the run as finished, so it is not resumed
+
+        :return:
+        """
+
+        with self.connection:
+            self.connection.execute('UPDATE crawl_runs SET finished = ? WHERE run_id = ?',
+                                    (datetime.today().isoformat(timespec='seconds'), self.run_id))
+
+    def close(self):
+        if self.connection is None:
+            return
+        self.connection.close()
+        self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # the run is finished only if the parse and the final write of the sink succeeded for every page
+        if exc_type is None and not self.failed_pages:
+            self.finish()
+        elif exc_type is None:
+            print(f'Не разобраны страницы {sorted(self.failed_pages)}, парсинг можно продолжить')
+        self.close()
+
+
+def create_checkpoint_tables(connection):
+    """
+    Makes 'crawl_runs' and 'crawl_checkpoints' tables if they do not exist
+
+    :param connection: Connection to the sqlite3 database
+    :return:
+    """
+
+    with connection:
+        connection.execute('CREATE TABLE IF NOT EXISTS crawl_runs (run_id INTEGER PRIMARY KEY, shop TEXT NOT NULL, '
+                           'url TEXT NOT NULL, table_name TEXT, page_amount INTEGER, started TEXT, finished TEXT)')
+        connection.execute('CREATE TABLE IF NOT EXISTS crawl_checkpoints (run_id INTEGER NOT NULL, '
+                           'page INTEGER NOT NULL, PRIMARY KEY (run_id, page))')
+
+
+def with_checkpoint(handle, sink):
+    """
+    Wraps a page handler of 'crawl_pages' so that every handled page is reported to the sink as completed.
+    None page data means an unchanged page, it is completed without rows. A page is completed only after
+    the handler returns, so a page without data, e.g. with NoDataError, fails the parse and is parsed again
+    on resume
+
+    :param handle: Function that gets a page number and page data and saves rows of the page into the sink
+    :param sink: Sink of the current parse
+    :return: wrapped handler
+    """
+
+    def handle_page(page_number, page_data):
+        handle(page_number, page_data)
+        sink.complete_page(page_number)
+
+    return handle_page
@@ -2,4 +2,13 @@ from random_user_agent.user_agent import UserAgent
 
 return_codes = {'OK': 200, 'Error': '400'}
 
+database_path = '../ParsingResults.db'
+results_directory = '../ParsingResults'
+cache_path = '../ParsingCache.db'
+rate_limits_path = '../RateLimits.json'
+queue_path = '../ParsingQueue.db'
+
+# date format of the names of result tables and files
+table_date_format = '%d_%m_%Y_%H_%M_%S'
+
 user_agent_rotator = UserAgent()
@@ -0,0 +1,200 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlsplit
+import asyncio
+import multiprocessing
+
+
+class HostLimits:
+    """
+    Limits the amount of simultaneous requests and requests per second for every host
+    """
+
+    def __init__(self, per_host=4, requests_per_second=None):
+        """
+        :param per_host: Maximum amount of simultaneous requests to one host
+        :param requests_per_second: Maximum amount of requests to one host per second. Not limited if None
+        """
+
+        self.per_host = per_host
+        self.requests_per_second = requests_per_second
+        self.semaphores = {}
+        self.next_request_times = {}
+
+    def get_semaphore(self, host):
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.per_host)
+        return self.semaphores[host]
+
+    async def wait_turn(self, host):
+        """
+        Waits until a request to the given host is allowed by requests_per_second
+
+        :param host: Target host
+        :return:
+        """
+
+        if not self.requests_per_second:
+            return
+        now = asyncio.get_running_loop().time()
+        request_time = max(now, self.next_request_times.get(host, now))
+        self.next_request_times[host] = request_time + 1 / self.requests_per_second
+        await asyncio.sleep(request_time - now)
+
+
+def get_parse_executor(processes=None):
+    """
+    Makes a process pool for parsing. Processes are started by spawn, because forking a process with running
+    fetching threads can copy locks held by them and hang the child
+
+    :param processes: Amount of processes. Equal to the amount of cpu cores if None
+    :return: process pool
+    :rtype: ProcessPoolExecutor
+    """
+
+    return ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'))
+
+
+def parse_chunk(parse, pages):
+    """
+    Parses several pages in one call of a parsing process
+
+    :param parse: Function that gets page data and the page number, like parse of 'crawl_pages'
+    :param pages: Pages in a format of [(page data, page number), ...]
+    :return: parse results in the order of pages
+    :rtype: list
+    """
+
+    return [parse(page_data, page_number) for page_data, page_number in pages]
+
+
+async def crawl_pages_async(urls, fetch, handle, concurrency, limits, fetched=None, prefetch=1, parse=None,
+                            processes=None, stop=None, chunk_size=1):
+    """
+    Coroutine version of 'crawl_pages'
+    """
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    # pages that are fetched or wait for handling, so fetching runs ahead of handling by at most prefetch pages
+    window = asyncio.Semaphore(concurrency + prefetch)
+    fetched = fetched or {}
+    fetch_executor = ThreadPoolExecutor(concurrency, thread_name_prefix='fetch')
+    # pages are handled one at a time, so parsers do not need to be thread safe
+    handle_executor = ThreadPoolExecutor(1, thread_name_prefix='handle')
+    parse_executor = None if parse is None else get_parse_executor(processes)
+    # fetched pages that wait for a parsing process in a format of [((page data, page number), future)]
+    pending = []
+    parse_tasks = []
+    fetching = 0
+    # pages are handled in the order of urls, so products seen on several pages keep the rank of the first one.
+    # Pages get window places in the same order, so the next page to handle is always fetched or being fetched
+    handled = {page_number: asyncio.Event() for page_number in urls}
+    previous_pages = dict(zip(list(urls)[1:], urls))
+
+    async def parse_pending(chunk):
+        try:
+            results = await loop.run_in_executor(parse_executor, parse_chunk, parse, [page for page, _ in chunk])
+        except Exception as error:
+            for _, result in chunk:
+                if not result.done():
+                    result.set_exception(error)
+            return
+        for (_, result), page_result in zip(chunk, results):
+            if not result.done():
+                result.set_result(page_result)
+
+    async def crawl_page(page_number, url):
+        nonlocal fetching
+        async with window:
+            if stop is not None and stop.is_set():
+                handled[page_number].set()
+                return
+            if page_number in fetched:
+                result = fetched[page_number]
+            else:
+                host = urlsplit(url).netloc
+                async with semaphore, limits.get_semaphore(host):
+                    await limits.wait_turn(host)
+                    fetching += 1
+                    try:
+                        result = await loop.run_in_executor(fetch_executor, fetch, url)
+                    finally:
+                        fetching -= 1
+                parsed = None
+                if parse is not None and result is not None:
+                    parsed = loop.create_future()
+                    pending.append(((result, page_number), parsed))
+                # a chunk is sent once it is full or no other page is being fetched to fill it
+                if pending and (len(pending) >= chunk_size or not fetching):
+                    parse_tasks.append(asyncio.ensure_future(parse_pending(pending[:])))
+                    del pending[:]
+                if parsed is not None:
+                    result = await parsed
+            if page_number in previous_pages:
+                await handled[previous_pages[page_number]].wait()
+            await loop.run_in_executor(handle_executor, handle, page_number, result)
+            handled[page_number].set()
+
+    tasks = [asyncio.ensure_future(crawl_page(page_number, url)) for page_number, url in urls.items()]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks + parse_tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, *parse_tasks, return_exceptions=True)
+        fetch_executor.shutdown(wait=True, cancel_futures=True)
+        handle_executor.shutdown(wait=True, cancel_futures=True)
+        if parse_executor is not None:
+            parse_executor.shutdown(wait=True, cancel_futures=True)
+
+
+def crawl_pages(urls, fetch, handle, concurrency=1, per_host=None, requests_per_second=None, fetched=None,
+                prefetch=1, parse=None, processes=None, stop=None, chunk_size=1):
+    """
+    Fetches pages concurrently and handles every fetched page. Pages can finish fetching in any order, but they
+    are handled in the order of urls, like in a sequential parse. Next pages are fetched while earlier ones are
+    handled, so even with one connection requests overlap with parsing and saving. If parse is passed, fetched
+    pages are parsed in a process pool before handling, so parsing does not hold the GIL of fetching and handling
+
+    :param urls: Page urls in a format of {page number: url}
+    :param fetch: Function that gets a page url and returns page data. Called from several threads
+    :param handle: Function that gets a page number and page data, e.g. saves products of the page.
+    Called for one page at a time
+    :param concurrency: Maximum amount of simultaneous requests
+    :param per_host: Maximum amount of simultaneous requests to one host. Equal to concurrency if None
+    :param requests_per_second: Maximum amount of requests to one host per second. Not limited if None
+    :param fetched: Data of already fetched pages in a format of {page number: page data}. These pages are
+    handled without fetching and parsing
+    :param prefetch: Pages are fetched ahead of handling, but no more than concurrency + prefetch pages are being
+    fetched, waiting or handled at once, so results do not pile up in memory
+    :param parse: Function that gets page data from fetch and the page number and returns data for handle,
+    e.g. rows of the page. Must be a module level function, so it can be sent to other processes.
+    Pages with None data are not parsed
+    :param processes: Amount of parsing processes. Equal to the amount of cpu cores if None
+    :param stop: threading.Event. Once it is set, pages that are not being fetched yet are skipped
+    :param chunk_size: Amount of fetched pages sent to a parsing process at once. Larger chunks lower the overhead
+    of small pages. A chunk is sent earlier if no other page is being fetched, so chunks are never larger than
+    concurrency + prefetch
+    :return:
+    """
+
+    limits = HostLimits(per_host or concurrency, requests_per_second)
+    asyncio.run(crawl_pages_async(urls, fetch, handle, concurrency, limits, fetched, prefetch, parse, processes,
+                                    stop, chunk_size))
+
+
+def parse_pages(pages, parse, processes=None, chunk_size=1):
+    """
+    Parses pages in a process pool
+
+    :param pages: Page data in a format of {page number: page data}
+    :param parse: Function that gets page data and the page number, like parse of 'crawl_pages'
+    :param processes: Amount of parsing processes. Equal to the amount of cpu cores if None
+    :param chunk_size: Amount of pages sent to a process at once. Larger chunks lower the overhead of small pages
+    :return: Parse results in a format of {page number: result}
+    :rtype: dict
+    """
+
+    with get_parse_executor(processes) as executor:
+        results = executor.map(parse, pages.values(), pages.keys(), chunksize=chunk_size)
+        return dict(zip(pages.keys(), results))
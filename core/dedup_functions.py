@@ -0,0 +1,96 @@
+import hashlib
+import math
+
+
+class SeenSet:
+    """
+    Codes of products already saved in the current parse. Product lists shift while they are parsed,
+    so a product can appear on two pages. Only its first appearance is saved. 'crawl_pages' handles pages in
+    page order, so it keeps its best rank
+    """
+
+    def __init__(self):
+        self.codes = set()
+
+    def add(self, code):
+        """
+        Remembers a code
+
+        :param code: Code or article of a product
+        :return: True if the code was not seen before
+        :rtype: bool
+        """
+
+        if code in self.codes:
+            return False
+        self.codes.add(code)
+        return True
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class BloomFilter:
+    """
+    Seen set of a fixed size for very large catalogs. A new code is taken for a seen one with probability
+    error_rate, so such a product is skipped. A seen code is never taken for a new one
+    """
+
+    def __init__(self, capacity, error_rate=0.0001):
+        """
+        Makes an empty filter
+
+        :param capacity: Expected amount of codes
+        :param error_rate: Probability to take a new code for a seen one once capacity codes are added
+        """
+
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_amount = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.amount = 0
+
+    def get_positions(self, code):
+        # k positions are made from two halves of one digest
+        digest = hashlib.blake2b(str(code).encode(), digest_size=16).digest()
+        first_hash = int.from_bytes(digest[:8], 'little')
+        second_hash = int.from_bytes(digest[8:], 'little') | 1
+        return [(first_hash + i * second_hash) % self.size for i in range(self.hash_amount)]
+
+    def add(self, code):
+        """
+        Remembers a code
+
+        :param code: Code or article of a product
+        :return: True if the code was not seen before
+        :rtype: bool
+        """
+
+        new = False
+        for position in self.get_positions(code):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                new = True
+        self.amount += new
+        return new
+
+    def __len__(self):
+        return self.amount
+
+
+def get_seen_set(page_amount, page_size=100, bloom_threshold=5000000, error_rate=0.0001):
+    """
+    Makes a seen set for a parse. A set of codes is used for usual catalogs and a Bloom filter for very large ones
+
+    :param page_amount: Amount of pages of the product list
+    :param page_size: Maximum amount of products on a page
+    :param bloom_threshold: Expected amount of products from which a Bloom filter is used
+    :param error_rate: Error rate of the Bloom filter
+    :return: seen set
+    :rtype: SeenSet or BloomFilter
+    """
+
+    capacity = page_amount * page_size
+    if capacity >= bloom_threshold:
+        return BloomFilter(capacity, error_rate)
+    return SeenSet()
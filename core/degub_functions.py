@@ -1,4 +1,208 @@
+import html
+import json
+import time
+from bs4 import BeautifulSoup
+from .crawl_functions import parse_pages
+from .formatting_functions import get_number
+from .extraction_functions import get_attribute_json, get_script_json
+
+
 def write_dict(given_dict):
     for i in given_dict.keys():
         print(f'{i}: {given_dict[i]}')
     print()
+
+
+def benchmark(functions, repeat=20):
+    """
+    Measures average time of a call of every given function and prints it
+
+    :param functions: Functions without arguments in a format of {name: function}
+    :param repeat: Amount of calls of every function
+    :return: average times in seconds in a format of {name: time}
+    :rtype: dict
+    """
+
+    times = {}
+    for name, function in functions.items():
+        start_time = time.perf_counter()
+        for i in range(repeat):
+            function()
+        times[name] = (time.perf_counter() - start_time) / repeat
+        print(f'{name}: {times[name] * 1000:.2f} ms')
+    print()
+    return times
+
+
+def make_test_page(data, product_amount=36, markup_size=3000):
+    """
+    Makes a page that looks like a product list page with the given data embedded into it in the ways
+    Ozon, DetMir and MyShop embed their data
+
+    :param data: Data of the page
+    :param product_amount: Amount of products in the markup
+    :param markup_size: Amount of extra tags in the markup
+    :return: html of the page
+    :rtype: str
+    """
+
+    json_text = json.dumps(data, ensure_ascii=False)
+    markup = ''.join(f'<div class="tile"><a href="/product/{i}/"><span class="price">{i} ₽</span></a></div>'
+                     for i in range(product_amount))
+    markup += '<div class="filler"><span>text</span></div>' * markup_size
+    return (f'<html><head><script src="/app.js"></script><script>window.__DATA__ = {json_text};</script></head>'
+            f'<body>{markup}<div id="state-searchResultsV2-312617-default-1" data-state=\'{html.escape(json_text)}\'>'
+            f'</div><script id="app-data" type="application/json">{html.escape(json_text)}</script></body></html>')
+
+
+def benchmark_extraction(repeat=20, product_amount=36):
+    """
+    Compares extraction of embedded json by 'get_attribute_json' and 'get_script_json' with extraction
+    through a BeautifulSoup tree on a generated page
+
+    :param repeat: Amount of calls of every function
+    :param product_amount: Amount of products on the page
+    :return: average times in seconds in a format of {name: time}
+    :rtype: dict
+    """
+
+    data = {'items': [{'id': i, 'name': f'Товар "{i}" & <аксессуар>', 'price': {'price': f'{i} ₽'},
+                       'images': [f'https://cdn.example.ru/{i}/{j}.jpg' for j in range(10)]}
+                      for i in range(product_amount)]}
+    page = make_test_page(data, product_amount)
+
+    def soup_attribute():
+        soup = BeautifulSoup(page, 'lxml')
+        return json.loads(soup.find('div', {'id': 'state-searchResultsV2-312617-default-1'})['data-state'])
+
+    def soup_script():
+        soup = BeautifulSoup(page, 'html.parser')
+        json_text = str(soup.find('script', {'id': 'app-data'}))
+        json_text = json_text[json_text.find('{'):json_text.rfind('</script>')]
+        return json.loads(html.unescape(json_text))
+
+    def soup_script_index():
+        soup = BeautifulSoup(page, 'html.parser')
+        json_text = str(soup.find_all('script')[1])
+        return json.loads(json_text[json_text.find('{'):json_text.rfind('};') + 1])
+
+    functions = {'soup attribute (Ozon)': soup_attribute,
+                 'scan attribute (Ozon)': lambda: get_attribute_json(page, 'state-searchResultsV2-312617-default-1'),
+                 'soup script by id (DetMir)': soup_script,
+                 'scan script by id (DetMir)': lambda: get_script_json(page, 'app-data'),
+                 'soup script by index (MyShop)': soup_script_index,
+                 'scan script by index (MyShop)': lambda: get_script_json(page, index=1, end='};', unescape=False)}
+    for name, function in functions.items():
+        if function() != data:
+            raise ValueError(f'{name} extracted wrong data')
+    return benchmark(functions, repeat)
+
+
+def make_listing_page(product_amount=100, markup_size=3000):
+    """
+    Makes a page that looks like a product list page of WildBerries. Every third product is not on sale and
+    every fifth product has no rating
+
+    :param product_amount: Amount of products on the page
+    :param markup_size: Amount of extra tags in the markup
+    :return: html of the page
+    :rtype: str
+    """
+
+    cards = []
+    for i in range(product_amount):
+        price = 1000 + 10 * i
+        old_price = '' if i % 3 == 0 else \
+            f'<span class="price-old-block"><del>{price * 2} ₽</del><span class="price-sale active">-50%</span></span>'
+        rating = '' if i % 5 == 0 else f'<span class="c-stars-line-lg stars-line-lg star{i % 5}"></span>'
+        cards.append(f'<div class="dtList i-dtList j-card-item"><a class="ref_goods_n_p j-open-full-product-card" '
+                     f'href="/catalog/{10000 + i}/detail.aspx?targetUrl=BP"><div class="l_class">'
+                     f'<img class="thumbnail" src="//img.example.ru/{10000 + i}-1.jpg" alt=""></div>'
+                     f'<div class="dtlist-inner-brand"><strong class="brand-name c-text-sm">Бренд {i % 7} / </strong>'
+                     f'<span class="goods-name c-text-sm">Товар {i}</span></div><span class="price">'
+                     f'<ins class="lower-price">{price} ₽</ins>{old_price}</span>{rating}'
+                     f'<span class="dtList-comments-count c-text-sm">{i * 3}</span></a></div>')
+    markup = '<div class="filler"><span>text</span></div>' * markup_size
+    return (f'<html><head><script src="/app.js"></script></head><body>{markup}'
+            f'<span class="goods-count j-goods-count">Всего {product_amount} товаров</span>'
+            f'<div class="catalog_main_table">{"".join(cards)}</div></body></html>')
+
+
+def get_soup_listing_rows(page):
+    """
+    Gets products from html of a product list page of WildBerries through a BeautifulSoup tree. Reference
+    extraction of 'benchmark_listing_extraction'
+
+    :param page: Html of the page
+    :return: Products' information of the first page in the order of the database, with names from the list
+    :rtype: list
+    """
+
+    rows = []
+    for i, element in enumerate(BeautifulSoup(page, 'html.parser').find_all(
+            'a', class_='ref_goods_n_p j-open-full-product-card')):
+        lower_price = element.find('ins', class_='lower-price') or element.find('span', class_='lower-price')
+        lower_price = get_number(lower_price.text)
+        non_sale_price = element.find('span', class_='price-old-block')
+        non_sale_price = lower_price if non_sale_price is None else get_number(non_sale_price.find('del').text)
+        sale = element.find('span', class_='price-sale active')
+        rating = element.find('span', class_='c-stars-line-lg')
+        review_amount = element.find('span', class_='dtList-comments-count')
+        name = element.find('span', class_='goods-name')
+        brand = element.find('strong', class_='brand-name').text.split('/')[0]
+        rows.append((brand[:len(brand)-1], name.text.strip() if name is not None else None, non_sale_price,
+                     0 if sale is None else get_number(sale.text), lower_price, i + 1,
+                     None if rating is None else get_number(rating['class'][-1][-1], float),
+                     0 if review_amount is None else get_number(review_amount.text),
+                     'https:' + element.find('img', class_='thumbnail')['src'], element['href'].split('/')[2]))
+    return rows
+
+
+def benchmark_listing_extraction(extract_rows, paths=None, repeat=10, product_amount=100):
+    """
+    Compares extraction of products from product list pages by the given extraction with extraction through
+    a BeautifulSoup tree
+
+    :param extract_rows: Function that gets html of a page and the page number and returns rows, e.g.
+    'extract_rows' of WildBerries parser
+    :param paths: Paths to saved html pages of the product list. A page from 'make_listing_page' is used if None
+    :param repeat: Amount of extractions of every page
+    :param product_amount: Amount of products on the generated page
+    :return: average times of extraction of all pages in seconds in a format of {name: time}
+    :rtype: dict
+    """
+
+    pages = []
+    for path in paths or ():
+        with open(path, encoding='utf-8') as file:
+            pages.append(file.read())
+    if not pages:
+        pages.append(make_listing_page(product_amount))
+    for page in pages:
+        if get_soup_listing_rows(page) != extract_rows(page, 1):
+            raise ValueError('Extractions differ')
+    return benchmark({'BeautifulSoup': lambda: [get_soup_listing_rows(page) for page in pages],
+                      'lxml one pass': lambda: [extract_rows(page, 1) for page in pages]}, repeat)
+
+
+def benchmark_parse(pages, parse, process_amounts=(1, 2, 4), chunk_size=1):
+    """
+    Measures how many rows per second 'parse_pages' extracts with different amounts of processes and prints it
+
+    :param pages: Page data in a format of {page number: page data}, e.g. saved html pages
+    :param parse: Function that gets page data and the page number and returns rows, e.g. 'extract_rows'
+    of a parser
+    :param process_amounts: Amounts of processes to measure
+    :param chunk_size: Amount of pages sent to a process at once
+    :return: rows per second in a format of {amount of processes: rows per second}
+    :rtype: dict
+    """
+
+    speeds = {}
+    for processes in process_amounts:
+        start_time = time.perf_counter()
+        results = parse_pages(pages, parse, processes, chunk_size)
+        speeds[processes] = sum(len(rows) for rows in results.values()) / (time.perf_counter() - start_time)
+        print(f'{processes} processes: {speeds[processes]:.0f} rows/sec')
+    print()
+    return speeds
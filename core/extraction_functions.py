@@ -0,0 +1,317 @@
+import html
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# default of 'next' that can not be a value of decoded json
+missing = object()
+
+# ids of state widgets in the form of 'state-<type>-<anything>'
+state_id_pattern = re.compile(r'''id=["'](state-([^-"']+)-[^"']*)["']''')
+
+
+class NoDataError(Exception):
+    """
+    Raised when a page has none of the expected data, e.g. a blocked or changed page. Unlike an unchanged page,
+    such a page must not be taken as parsed
+    """
+
+
+def loads(json_text):
+    """
+    Converts json text into python structure. Uses orjson if it is installed
+
+    :param json_text: Json text
+    :return: python structure
+    """
+
+    if orjson is not None:
+        return orjson.loads(json_text)
+    return json.loads(json_text)
+
+
+def decode_entities(text):
+    """
+    Decodes html entities. Text without entities is returned as is. Text with only the entities that html
+    escaping makes is decoded by plain replaces, which is much faster than html.unescape on large json
+
+    :param text: Text from html
+    :return: decoded text
+    :rtype: str
+    """
+
+    if '&' not in text:
+        return text
+    decoded = text.replace('&quot;', '"').replace('&#x27;', "'").replace('&#39;', "'").replace('&lt;', '<') \
+        .replace('&gt;', '>')
+    # '&amp;' is decoded last, so the entities it makes are not decoded twice
+    if decoded.count('&') == decoded.count('&amp;'):
+        return decoded.replace('&amp;', '&')
+    return html.unescape(text)
+
+
+def find_tag_start(page, tag_id):
+    """
+    Finds the tag with the given id without parsing the page
+
+    :param page: Html of the page
+    :param tag_id: Id of the tag
+    :return: position of the tag's '<' and position after the tag's '>'. (-1, -1) if there is no such tag
+    :rtype: tuple
+    """
+
+    for quote in '"\'':
+        position = page.find(f'id={quote}{tag_id}{quote}')
+        if position != -1:
+            break
+    else:
+        return -1, -1
+    return page.rfind('<', 0, position), page.find('>', position) + 1
+
+
+def get_attribute(page, tag_id, attribute):
+    """
+    Gets the value of an attribute of the tag with the given id without parsing the page
+
+    :param page: Html of the page
+    :param tag_id: Id of the tag
+    :param attribute: Name of the attribute
+    :return: decoded value. None if there is no such tag or attribute
+    :rtype: str
+    """
+
+    start, end = find_tag_start(page, tag_id)
+    if start == -1:
+        return None
+    # the attribute is searched inside the tag only, so an attribute of a later tag is not taken
+    position = page.find(f' {attribute}=', start, end)
+    if position == -1:
+        return None
+    position += len(attribute) + 2
+    quote = page[position]
+    return decode_entities(page[position + 1:page.find(quote, position + 1)])
+
+
+def find_script(page, script_id=None, index=None):
+    """
+    Finds the text of a script without parsing the page
+
+    :param page: Html of the page
+    :param script_id: Id of the script
+    :param index: Index of the script among all scripts of the page. Used if script_id is None
+    :return: position of the first character of the text and position after the text. (-1, -1) if there is no
+    such script
+    :rtype: tuple
+    """
+
+    if script_id is not None:
+        start, end = find_tag_start(page, script_id)
+        if start == -1:
+            return -1, -1
+    else:
+        end = 0
+        for i in range(index + 1):
+            start = page.find('<script', end)
+            if start == -1:
+                return -1, -1
+            end = page.find('>', start) + 1
+            if i < index:
+                end = page.find('</script>', end)
+    return end, page.find('</script>', end)
+
+
+def get_script_text(page, script_id=None, index=None):
+    """
+    Gets the text of a script without parsing the page
+
+    :param page: Html of the page
+    :param script_id: Id of the script
+    :param index: Index of the script among all scripts of the page. Used if script_id is None
+    :return: text of the script. None if there is no such script
+    :rtype: str
+    """
+
+    start, end = find_script(page, script_id, index)
+    if start == -1:
+        return None
+    return page[start:end]
+
+
+def index_state_widgets(page):
+    """
+    Finds ids of all state widgets of a page in one pass
+
+    :param page: Html of the page
+    :return: widget ids in the order of the page in a format of {widget type: [widget ids]},
+    e.g. {'searchResultsV2': ['state-searchResultsV2-312617-default-1']}
+    :rtype: dict
+    """
+
+    index = {}
+    for match in state_id_pattern.finditer(page):
+        index.setdefault(match.group(2), []).append(match.group(1))
+    return index
+
+
+def get_attribute_json(page, tag_id, attribute='data-state'):
+    """
+    Gets json data stored in an attribute of the tag with the given id
+
+    :param page: Html of the page
+    :param tag_id: Id of the tag
+    :param attribute: Name of the attribute
+    :return: data converted into python structure. None if there is no such tag or attribute
+    :rtype: dict
+    """
+
+    value = get_attribute(page, tag_id, attribute)
+    if value is None:
+        return None
+    return loads(value)
+
+
+def get_script_json(page, script_id=None, index=None, end='}', unescape=True):
+    """
+    Gets json data stored in a script. The data is taken from the first '{' to the last end of the script,
+    so assignments like 'window.data = {...};' are supported
+
+    :param page: Html of the page
+    :param script_id: Id of the script
+    :param index: Index of the script among all scripts of the page. Used if script_id is None
+    :param end: Text that ends the data
+    :param unescape: If True, html entities are decoded. Must be False for scripts with raw javascript, where
+    text like '&quot;' is a part of the data
+    :return: data converted into python structure. None if there is no such script
+    :rtype: dict
+    """
+
+    script = get_script_text(page, script_id, index)
+    if script is None:
+        return None
+    json_text = script[script.find('{'):script.rfind(end) + 1]
+    return loads(decode_entities(json_text) if unescape else json_text)
+
+
+class UnescapedReader:
+    """
+    File-like object that reads a part of html with decoded entities chunk by chunk, so the decoded text is never
+    stored whole
+    """
+
+    def __init__(self, page, start, end, unescape=True):
+        """
+        :param page: Html of the page
+        :param start: Position of the first read character
+        :param end: Position after the last read character
+        :param unescape: If False, the text is read as is
+        """
+
+        self.page = page
+        self.position = start
+        self.end = end
+        self.unescape = unescape
+
+    def read(self, size=65536):
+        if size is None or size < 0:
+            size = self.end - self.position
+        chunk_end = min(self.position + size, self.end)
+        if not self.unescape:
+            chunk = self.page[self.position:chunk_end]
+            self.position = chunk_end
+            return chunk.encode()
+        # an entity cut by the end of the chunk is left for the next chunk
+        entity_start = self.page.rfind('&', max(self.position, chunk_end - 10), chunk_end)
+        if entity_start > self.position and chunk_end < self.end and \
+                self.page.find(';', entity_start, chunk_end) == -1:
+            chunk_end = entity_start
+        chunk = self.page[self.position:chunk_end]
+        self.position = chunk_end
+        return decode_entities(chunk).encode()
+
+
+def iter_path(data, keys):
+    """
+    Yields values of decoded json found by a path in ijson format
+
+    :param data: Decoded json
+    :param keys: Keys of the path. 'item' means every element of an array
+    :return: generator of values
+    """
+
+    if not keys:
+        yield data
+    elif keys[0] == 'item' and isinstance(data, list):
+        for value in data:
+            yield from iter_path(value, keys[1:])
+    elif isinstance(data, dict) and keys[0] in data:
+        yield from iter_path(data[keys[0]], keys[1:])
+
+
+def iter_script_json(page, path, script_id=None, index=None, end='}', unescape=True):
+    """
+    Yields values found by a path in json data stored in a script, e.g. 'catalog.data.items.item' yields products
+    one by one. With ijson package the rest of the data is skipped without making python objects and every value
+    is yielded as soon as it is decoded. Without ijson the whole data is decoded first
+
+    :param page: Html of the page
+    :param path: Path in ijson format. 'item' means every element of an array
+    :param script_id: Id of the script
+    :param index: Index of the script among all scripts of the page. Used if script_id is None
+    :param end: Text that ends the data
+    :param unescape: If True, html entities are decoded. Must be False for scripts with raw javascript
+    :return: generator of values. NoDataError is raised at once if there is no such script and by the generator
+    if the data has no such path, so a page without data is not taken for a page without products
+    :rtype: generator
+    """
+
+    script_start, script_end = find_script(page, script_id, index)
+    if script_start == -1:
+        raise NoDataError(f'Нет скрипта {script_id if script_id is not None else index} на странице')
+    # the page is read in place, so neither the script nor the decoded data is copied whole
+    start = page.find('{', script_start, script_end)
+    stop = page.rfind(end, script_start, script_end) + 1
+    return iter_json(page, start, stop, path, unescape)
+
+
+def iter_json(page, start, stop, path, unescape=True):
+    """
+    Yields values found by a path in json data stored in a part of the page
+
+    :param page: Html of the page
+    :param start: Position of the first character of the data
+    :param stop: Position after the last character of the data
+    :param path: Path in ijson format. 'item' means every element of an array
+    :param unescape: If True, html entities are decoded
+    :return: generator of values. NoDataError is raised if the data has no such path, so a changed page is not
+    taken for a page without products. A path that ends with an empty array yields nothing
+    """
+
+    # an array at the end of the path can be empty, the rest of the path must be in the data
+    keys = path.split('.')
+    while keys and keys[-1] == 'item':
+        keys.pop()
+    if ijson is None:
+        json_text = page[start:stop]
+        data = loads(decode_entities(json_text) if unescape else json_text)
+        if next(iter_path(data, keys), missing) is missing:
+            raise NoDataError(f'Нет данных {path} на странице')
+        yield from iter_path(data, path.split('.'))
+        return
+    found = False
+    for value in ijson.items(UnescapedReader(page, start, stop, unescape), path, use_float=True):
+        found = True
+        yield value
+    # nothing was found, so the data is read again to tell an empty array from a missing path
+    container = '.'.join(keys)
+    if not found and not any(prefix == container for prefix, event, value in
+                             ijson.parse(UnescapedReader(page, start, stop, unescape), use_float=True)):
+        raise NoDataError(f'Нет данных {path} на странице')
@@ -1,3 +1,6 @@
+import re
+
+
 def space_delete(inp):
     """
     Removes a space in the beginning of the input string if it exists
@@ -33,6 +36,40 @@ def get_str_table_struct(table_struct):
     return str_table_struct
 
 
+def get_str_index_queries(table_name, indexes):
+    """
+    Makes sql queries that create secondary indexes of the given table
+
+    :param table_name: Name of an existing table in the database
+    :param indexes: A list of indexes in a format of (column, ...)
+    :return: sql queries
+    :rtype: list
+    """
+
+    queries = []
+    for i, columns in enumerate(indexes):
+        queries.append(f"CREATE INDEX IF NOT EXISTS {table_name}_index_{i} ON {table_name} ({', '.join(columns)});")
+    return queries
+
+
+def get_number(inp, number_type=int):
+    """
+    Converts a price, discount, rating or amount into a number. Spaces, currency and percent signs are ignored
+
+    :param inp: Number or a string containing a number, e.g. '1 299 ₽' or '-25%'
+    :param number_type: int or float
+    :return: Number. If the input contains no number returns None
+    :rtype: int or float
+    """
+
+    if inp is None or isinstance(inp, (int, float)):
+        return inp if inp is None else number_type(inp)
+    digits = re.sub(r'[^\d.,]', '', inp).replace(',', '.').strip('.')
+    if not digits:
+        return None
+    return number_type(float(digits))
+
+
 def get_new_headers(headers, user_agent_rotator):
     """
     Inserts a random User-Agent into passed headers
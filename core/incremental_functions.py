@@ -0,0 +1,167 @@
+import hashlib
+import json
+import threading
+import time
+from .cache_functions import DiskCache
+from .save_functions import get_column_name, get_key_index
+
+
+class PageFingerprints:
+    """
+    Fingerprints of the pages of a product list made from the products' codes, final prices and positions.
+    Fingerprints of every parse are saved, so an incremental parse can stop once enough consecutive pages are
+    equal to the previous parse. Meant for lists sorted by newest or by price, where changes gather on the first
+    pages. A parse that stopped early has no rows of the skipped pages, so it must be saved with '.history'
+    """
+
+    def __init__(self, shop_name, url, incremental=False, stop_pages=3, full_parse_interval=24 * 60 * 60,
+                 cache=None):
+        """
+        Loads fingerprints of the previous parse of the url
+
+        :param shop_name: Name of the target shop
+        :param url: Url of the product list
+        :param incremental: If True, the parse stops early on unchanged pages
+        :param stop_pages: Amount of consecutive unchanged pages that stops an incremental parse
+        :param full_parse_interval: An incremental parse does not stop if the last full parse is older than that
+        many seconds
+        :param cache: DiskCache for the fingerprints. '{shop_name}_fingerprints' cache is used if None
+        """
+
+        self.url = url
+        self.stop_pages = stop_pages
+        self.own_cache = cache is None
+        self.cache = DiskCache(f'{shop_name}_fingerprints', None) if cache is None else cache
+        previous = self.cache.get(url) or {'pages': {}, 'full_parse': 0}
+        self.previous_pages = previous['pages']
+        self.last_full_parse = previous['full_parse']
+        self.full_parse = not incremental or time.time() - self.last_full_parse >= full_parse_interval
+        self.pages = {}
+        self.matches = {}
+        # pages that were not changed since the previous parse according to revalidation
+        self.unchanged_pages = set()
+        # set once the parse can stop, pages that are not fetched yet are skipped by 'crawl_pages'
+        self.stop = threading.Event()
+
+    def attach(self, sink, table_structure):
+        """
+        Wraps a sink so that rows saved into it are fingerprinted page by page. Pages are completed by
+        'with_checkpoint'
+
+        :param sink: Sink of the current parse
+        :param table_structure: Table structure of the sink
+        :return: fingerprinting sink
+        :rtype: FingerprintSink
+        """
+
+        return FingerprintSink(self, sink, table_structure)
+
+    def track(self, handle):
+        """
+        Wraps a page handler of 'crawl_pages' so that pages with None data, i.e. not changed since the previous
+        parse, are taken as equal to it. Must wrap the handler from 'with_checkpoint'
+
+        :param handle: Function that gets a page number and page data
+        :return: wrapped handler
+        """
+
+        def handle_page(page_number, page_data):
+            if page_data is None:
+                self.unchanged_pages.add(page_number)
+            handle(page_number, page_data)
+
+        return handle_page
+
+    def add_page(self, page_number, products):
+        """
+        Records the fingerprint of a page and sets stop once enough consecutive pages are unchanged
+
+        :param page_number: Number of the page
+        :param products: Products of the page in a format of (code, final price), in the order of the page.
+        An empty page breaks the run of unchanged pages, unless it was not changed according to revalidation
+        :return:
+        """
+
+        key = str(page_number)
+        if products:
+            fingerprint = hashlib.sha1(json.dumps([[code, price, position] for position, (code, price)
+                                                   in enumerate(products)]).encode()).hexdigest()
+            self.pages[key] = fingerprint
+            self.matches[page_number] = self.previous_pages.get(key) == fingerprint
+        else:
+            # products of an empty page can not be compared, e.g. all of them were seen on earlier pages
+            self.matches[page_number] = page_number in self.unchanged_pages
+        if self.full_parse or not self.matches[page_number]:
+            return
+        first = last = page_number
+        while self.matches.get(first - 1):
+            first -= 1
+        while self.matches.get(last + 1):
+            last += 1
+        if last - first + 1 >= self.stop_pages:
+            self.stop.set()
+
+    def save(self):
+        """
+        Saves fingerprints of the parse. Pages skipped by an early stop keep their previous fingerprints
+
+        :return:
+        """
+
+        pages = self.pages if self.full_parse else {**self.previous_pages, **self.pages}
+        self.cache.set(self.url, {'pages': pages,
+                                  'full_parse': time.time() if self.full_parse else self.last_full_parse})
+
+    def close(self):
+        if self.own_cache:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # fingerprints of a failed parse are not saved, so its pages are not taken as unchanged next time
+        try:
+            if exc_type is None:
+                self.save()
+        finally:
+            self.close()
+
+
+class FingerprintSink:
+    """
+    Sink that collects codes and final prices of saved rows for PageFingerprints. Has the same interface as
+    the sinks from 'save_options'
+    """
+
+    def __init__(self, fingerprints, sink, table_structure):
+        self.fingerprints = fingerprints
+        self.sink = sink
+        columns = [get_column_name(field) for field in table_structure]
+        self.key_index = get_key_index(table_structure)
+        self.price_index = columns.index('Итого')
+        self.products = []
+
+    def __getattr__(self, item):
+        return getattr(self.sink, item)
+
+    def save(self, row):
+        self.products.append((row[self.key_index], row[self.price_index]))
+        self.sink.save(row)
+
+    def complete_page(self, page_number):
+        self.fingerprints.add_page(page_number, self.products)
+        self.products = []
+        self.sink.complete_page(page_number)
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,180 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from .constants import rate_limits_path
+
+# parts of urls and small pages that mean the site asks for a captcha
+captcha_markers = ('captcha', 'showcaptcha', 'challenge')
+
+# rate limiter shared by all sessions of the process
+shared_rate_limiter = None
+shared_rate_limiter_lock = threading.Lock()
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket rate limiter for every domain. The rate of a domain grows slowly while its responses are healthy
+    and is cut in half on 429 responses, captchas, errors and latency spikes. Rates are saved into a file,
+    so the next parse starts at the last known safe rate
+    """
+
+    def __init__(self, state_path=rate_limits_path, initial_rate=2.0, min_rate=0.1, max_rate=20.0, increase=0.2,
+                 decrease=0.5, latency_factor=3.0, min_latency_spike=1.0, save_interval=30):
+        """
+        Loads saved rates
+
+        :param state_path: Path to the json file with saved rates. Rates are not saved if None
+        :param initial_rate: Requests per second for a domain without a saved rate
+        :param min_rate: Minimum requests per second
+        :param max_rate: Maximum requests per second
+        :param increase: Requests per second added after every healthy response
+        :param decrease: Rate multiplier used after an unhealthy response
+        :param latency_factor: A response is a latency spike if it is that many times slower than the average
+        :param min_latency_spike: Responses faster than that many seconds are never latency spikes
+        :param save_interval: Minimum pause between saves of the rates in seconds
+        """
+
+        self.state_path = state_path
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.min_latency_spike = min_latency_spike
+        self.save_interval = save_interval
+        self.last_save_time = time.time()
+        self.lock = threading.Lock()
+        self.buckets = {}
+        if state_path is not None and os.path.exists(state_path):
+            try:
+                with open(state_path, encoding='utf-8') as file:
+                    for host, state in json.load(file).items():
+                        self.buckets[host] = {'rate': float(state['rate']), 'latency': state['latency'],
+                                              'tokens': 1.0, 'updated': time.monotonic(), 'paused_until': 0.0}
+            except (OSError, ValueError, TypeError, KeyError, AttributeError) as error:
+                # a damaged file must not stop the parse, every domain starts at the initial rate
+                print(f'Сохраненные ограничения {state_path} не загружены: {error!r}')
+                self.buckets = {}
+        atexit.register(self.save)
+
+    def get_bucket(self, host):
+        if host not in self.buckets:
+            self.buckets[host] = {'rate': self.initial_rate, 'latency': None, 'tokens': 1.0,
+                                  'updated': time.monotonic(), 'paused_until': 0.0}
+        return self.buckets[host]
+
+    def acquire(self, host):
+        """
+        Waits until a request to the given host is allowed
+
+        :param host: Target host
+        :return:
+        """
+
+        while True:
+            with self.lock:
+                bucket = self.get_bucket(host)
+                now = time.monotonic()
+                bucket['tokens'] = min(1.0, bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+                bucket['updated'] = now
+                if now >= bucket['paused_until'] and bucket['tokens'] >= 1:
+                    bucket['tokens'] -= 1
+                    return
+                wait = max(bucket['paused_until'] - now, (1 - bucket['tokens']) / bucket['rate'])
+            time.sleep(wait)
+
+    def record(self, host, response=None, elapsed=None):
+        """
+        Adapts the rate of the given host to the result of a request
+
+        :param host: Target host
+        :param response: Response of the request. None if the request failed
+        :param elapsed: Duration of the request in seconds
+        :return:
+        """
+
+        with self.lock:
+            bucket = self.get_bucket(host)
+            healthy = response is not None and not is_blocked(response)
+            if healthy and elapsed is not None:
+                if bucket['latency'] is not None and elapsed > self.min_latency_spike and \
+                        elapsed > self.latency_factor * bucket['latency']:
+                    healthy = False
+                # latency spikes are not added into the average so that they stay noticeable
+                if healthy or bucket['latency'] is None:
+                    bucket['latency'] = elapsed if bucket['latency'] is None else \
+                        0.8 * bucket['latency'] + 0.2 * elapsed
+            if healthy:
+                bucket['rate'] = min(self.max_rate, bucket['rate'] + self.increase)
+            else:
+                bucket['rate'] = max(self.min_rate, bucket['rate'] * self.decrease)
+                bucket['tokens'] = min(bucket['tokens'], 0.0)
+                retry_after = None if response is None else response.headers.get('Retry-After')
+                if retry_after is not None and retry_after.isdigit():
+                    bucket['paused_until'] = time.monotonic() + int(retry_after)
+        if time.time() - self.last_save_time >= self.save_interval:
+            self.save()
+
+    def save(self):
+        """
+        Saves rates of all domains
+
+        :return:
+        """
+
+        if self.state_path is None:
+            return
+        with self.lock:
+            state = {host: {'rate': bucket['rate'], 'latency': bucket['latency']}
+                     for host, bucket in self.buckets.items()}
+            self.last_save_time = time.time()
+        # several processes save the same file, so it is replaced at once and never read half written
+        file_descriptor, temp_path = tempfile.mkstemp(prefix='.RateLimits_', suffix='.json',
+                                                      dir=os.path.dirname(os.path.abspath(self.state_path)))
+        try:
+            with os.fdopen(file_descriptor, 'w', encoding='utf-8') as file:
+                json.dump(state, file, indent=4)
+            os.replace(temp_path, self.state_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+
+def is_blocked(response):
+    """
+    Checks if the site refused to answer: 429 and 403 responses and captcha pages
+
+    :param response: requests.Response object
+    :return: True if the response is blocked
+    :rtype: bool
+    """
+
+    if response.status_code in (403, 429):
+        return True
+    url = response.url.lower()
+    if any(marker in url for marker in captcha_markers):
+        return True
+    # challenge pages are small, so large pages are not searched for markers
+    if len(response.content) < 20000:
+        content = response.content.lower()
+        return any(marker.encode() in content for marker in captcha_markers)
+    return False
+
+
+def get_rate_limiter():
+    """
+    Gets the rate limiter shared by all sessions of the process
+
+    :return: rate limiter
+    :rtype: AdaptiveRateLimiter
+    """
+
+    global shared_rate_limiter
+    with shared_rate_limiter_lock:
+        if shared_rate_limiter is None:
+            shared_rate_limiter = AdaptiveRateLimiter()
+        return shared_rate_limiter
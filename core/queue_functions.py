@@ -0,0 +1,207 @@
+import json
+import sqlite3
+import time
+from .constants import queue_path
+
+
+class TaskQueue:
+    """
+    Base class of task queues shared by workers. A leased task is hidden from other workers until its lease
+    expires, so tasks of crashed workers are leased again. Failed tasks are retried with a growing delay.
+    Backends for several hosts, e.g. on a database server, implement the same methods
+    """
+
+    def add(self, payloads):
+        """
+        Adds tasks to the queue
+
+        :param payloads: Data of the tasks. Must be convertible into json
+        :return:
+        """
+
+        raise NotImplementedError
+
+    def lease(self, worker, lease_time):
+        """
+        Takes the oldest available task
+
+        :param worker: Name of the worker
+        :param lease_time: Seconds during which the task is hidden from other workers
+        :return: task in a format of (task id, payload, attempt number). None if no task is available now
+        :rtype: tuple
+        """
+
+        raise NotImplementedError
+
+    def complete(self, task_id, worker):
+        """
+        Marks a leased task as done. Does nothing if the lease of the worker expired and the task was given to
+        another worker
+
+        :param task_id: Id of the task
+        :param worker: Name of the worker that leased the task
+        :return: True if the task was marked as done
+        :rtype: bool
+        """
+
+        raise NotImplementedError
+
+    def fail(self, task_id, worker, error):
+        """
+        Returns a leased task to the queue after a delay or marks it as failed once it has no attempts left.
+        Does nothing if the lease of the worker expired and the task was given to another worker
+
+        :param task_id: Id of the task
+        :param worker: Name of the worker that leased the task
+        :param error: Text of the error
+        :return: True if the task was returned or marked as failed
+        :rtype: bool
+        """
+
+        raise NotImplementedError
+
+    def get_counts(self):
+        """
+        Counts tasks by status
+
+        :return: amounts of tasks in a format of {status: amount}
+        :rtype: dict
+        """
+
+        raise NotImplementedError
+
+    def is_finished(self):
+        """
+        Checks if every task is done or failed
+
+        :return: True if no task is pending or leased
+        :rtype: bool
+        """
+
+        counts = self.get_counts()
+        return not counts.get('pending') and not counts.get('leased')
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SqliteTaskQueue(TaskQueue):
+    """
+    Task queue stored in a sqlite3 database, shared by worker processes of one machine
+    """
+
+    def __init__(self, db_path=queue_path, max_attempts=3, retry_delay=30):
+        """
+        Opens the queue and makes its table if it does not exist
+
+        :param db_path: Path to the sqlite3 database file of the queue
+        :param max_attempts: Amount of attempts after which a task is marked as failed
+        :param retry_delay: Delay before the first retry in seconds. Doubled after every attempt
+        """
+
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.connection = sqlite3.connect(db_path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS tasks (task_id INTEGER PRIMARY KEY, "
+                                    "payload TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending', "
+                                    "attempts INTEGER NOT NULL DEFAULT 0, available_at REAL NOT NULL DEFAULT 0, "
+                                    "worker TEXT, leased_until REAL, error TEXT)")
+            self.connection.execute('CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, available_at)')
+
+    def add(self, payloads):
+        with self.connection:
+            self.connection.executemany('INSERT INTO tasks (payload) VALUES (?)',
+                                        [(json.dumps(payload, ensure_ascii=False),) for payload in payloads])
+
+    def lease(self, worker, lease_time):
+        now = time.time()
+        with self.connection:
+            # tasks of workers that died on their last attempt are not leased again
+            self.connection.execute("UPDATE tasks SET status = 'failed', error = 'lease expired' "
+                                    "WHERE status = 'leased' AND leased_until < ? AND attempts >= ?",
+                                    (now, self.max_attempts))
+            # one statement, so two workers can not lease the same task
+            task = self.connection.execute(
+                "UPDATE tasks SET status = 'leased', worker = ?, leased_until = ?, attempts = attempts + 1 "
+                "WHERE task_id = (SELECT task_id FROM tasks WHERE (status = 'pending' AND available_at <= ?) "
+                "OR (status = 'leased' AND leased_until < ?) ORDER BY task_id LIMIT 1) "
+                "RETURNING task_id, payload, attempts", (worker, now + lease_time, now, now)).fetchone()
+        if task is None:
+            return None
+        return task[0], json.loads(task[1]), task[2]
+
+    def complete(self, task_id, worker):
+        with self.connection:
+            return self.connection.execute(
+                "UPDATE tasks SET status = 'done', leased_until = NULL "
+                "WHERE task_id = ? AND status = 'leased' AND worker = ?", (task_id, worker)).rowcount == 1
+
+    def fail(self, task_id, worker, error):
+        with self.connection:
+            return self.connection.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "available_at = ? + ? * (1 << (attempts - 1)), leased_until = NULL, error = ? "
+                "WHERE task_id = ? AND status = 'leased' AND worker = ?",
+                (self.max_attempts, time.time(), self.retry_delay, error, task_id, worker)).rowcount == 1
+
+    def get_counts(self):
+        return dict(self.connection.execute('SELECT status, count(*) FROM tasks GROUP BY status'))
+
+    def get_failed(self):
+        """
+        Gets tasks that have no attempts left
+
+        :return: failed tasks in a format of (task id, payload, error)
+        :rtype: list
+        """
+
+        return [(task_id, json.loads(payload), error) for task_id, payload, error in self.connection.execute(
+            "SELECT task_id, payload, error FROM tasks WHERE status = 'failed'")]
+
+    def close(self):
+        if self.connection is None:
+            return
+        self.connection.close()
+        self.connection = None
+
+
+def work(task_queue, run_task, worker, lease_time=300, poll_interval=1.0):
+    """
+    Runs tasks from the queue until every task is done or failed
+
+    :param task_queue: TaskQueue shared with other workers
+    :param run_task: Function that gets a task payload and runs the task. An exception fails the attempt
+    :param worker: Name of the worker
+    :param lease_time: Seconds a worker has for a task before it is given to another worker
+    :param poll_interval: Pause in seconds when no task is available but other workers still run tasks
+    :return: amount of completed tasks
+    :rtype: int
+    """
+
+    completed = 0
+    while True:
+        task = task_queue.lease(worker, lease_time)
+        if task is None:
+            if task_queue.is_finished():
+                return completed
+            time.sleep(poll_interval)
+            continue
+        task_id, payload, attempt = task
+        try:
+            run_task(payload)
+        except Exception as error:
+            print(f'{worker}: задача {task_id} не выполнена (попытка {attempt}): {error!r}')
+            task_queue.fail(task_id, worker, repr(error))
+        else:
+            if task_queue.complete(task_id, worker):
+                completed += 1
+            else:
+                print(f'{worker}: аренда задачи {task_id} истекла, задача передана другому исполнителю')
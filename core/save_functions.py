@@ -1,67 +1,639 @@
 from datetime import datetime
+from functools import partial
+import atexit
+import csv
+import gzip
+import io
+import json
+import os
 import sqlite3
-from .constants import return_codes
-from .formatting_functions import get_str_table_struct
+import uuid
+from .constants import return_codes, database_path, results_directory, table_date_format
+from .formatting_functions import get_str_table_struct, get_str_index_queries
+from .checkpoint_functions import create_checkpoint_tables
+from .writer_functions import WriterError
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
+# columns that change on every parse and are not stored by HistorySink
+history_ignored_columns = ('Популярность', 'Популярность рейтинг')
 
-def db_save(row, table_name, column_number):
+# supported file compressions and their extensions
+compressions = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+class DbSink:
+    """
+    Saves rows into a table inside sqlite3 database. Keeps one connection open for the whole parse,
+    buffers rows and writes them with executemany in batches. With a checkpoint only rows of completed pages
+    are written, together with the numbers of those pages. A product saved twice keeps one row, see 'get_upsert_query'
     """
-    Saves given row into the given table inside sqlite3 database
 
-    :param row: Row must be a tuple with elements in the same order as in the table
-    :param table_name: Must be a name of an existing table in the database
-    :param column_number: Number of columns in the table
-    :return: returns one of the return codes from core
+    def __init__(self, table_structure, shop_name, indexes=(), batch_size=500, db_path=database_path,
+                 checkpoint=None, table_name=None):
+        """
+        Makes a new table for the current parse and opens a connection to it
+
+        :param table_structure: A list of fields in a format of (name, type, modifiers).
+        If modifiers are passed they must start with a space
+        :param shop_name: Name of the target shop
+        :param indexes: A list of secondary indexes in a format of (column, ...)
+        :param batch_size: Amount of buffered rows that triggers a write into the database
+        :param db_path: Path to the sqlite3 database file
+        :param checkpoint: Checkpoint of the parse. If it is resumed, rows are saved into its table
+        :param table_name: Existing table to save rows into, e.g. a table shared by workers of a task queue.
+        A new table is made if None
+        """
+
+        if checkpoint is not None and checkpoint.resumed:
+            self.table_name = checkpoint.table_name
+        elif table_name is not None:
+            self.table_name = table_name
+        else:
+            self.table_name = create_table(table_structure, shop_name, db_path, indexes)
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.buffer = []
+        # amount of buffered rows that belong to completed pages and numbers of those pages
+        self.completed_rows = 0
+        self.completed_pages = []
+        self.query = get_upsert_query(self.table_name, table_structure)
+        self.connection = get_connection(db_path)
+        if checkpoint is not None:
+            create_checkpoint_tables(self.connection)
+            if not checkpoint.resumed:
+                checkpoint.start(self.table_name)
+        atexit.register(self.close)
+
+    def save(self, row):
+        """
+        Buffers given row and writes the buffer into the database once it is full
+
+        :param row: Row must be a tuple with elements in the same order as in the table
+        :return:
+        """
+
+        self.buffer.append(row)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def complete_page(self, page_number):
+        """
+        Marks all buffered rows as rows of completed pages. Without a checkpoint does nothing
+
+        :param page_number: Number of the page whose rows were all saved
+        :return:
+        """
+
+        if self.checkpoint is None:
+            return
+        self.completed_rows = len(self.buffer)
+        self.completed_pages.append(page_number)
+
+    def flush(self):
+        """
+        Writes all buffered rows into the database in one transaction. With a checkpoint rows of a page that is
+        not completed yet stay in the buffer
+
+        :return:
+        """
+
+        if self.connection is None:
+            return
+        if self.checkpoint is None:
+            rows = self.buffer
+        else:
+            rows = self.buffer[:self.completed_rows]
+        if not rows and not self.completed_pages:
+            return
+        with self.connection:
+            self.connection.executemany(self.query, rows)
+            if self.completed_pages:
+                self.checkpoint.save_pages(self.connection, self.completed_pages)
+        if self.completed_pages:
+            self.checkpoint.commit_pages(self.completed_pages)
+        del self.buffer[:len(rows)]
+        self.completed_rows = 0
+        self.completed_pages = []
+
+    def close(self):
+        """
+        Writes remaining rows and closes the connection. Safe to call more than once.
+        With a checkpoint rows of a page that is not completed are dropped, the page is parsed again on resume
+
+        :return:
+        """
+
+        if self.connection is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self.connection.close()
+            self.connection = None
+            atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class HistorySink:
+    """
+    Saves rows into shared 'products' and 'price_history' tables instead of a new table for every parse.
+    A product is written only if it is new or its price, discount, rating or availability changed.
+    With a checkpoint only changes of completed pages are written, together with the numbers of those pages
     """
 
-    try:
-        connection = sqlite3.connect('../ParsingResults.db')
-        cursor = connection.cursor()
-        cursor.execute(f"INSERT or REPLACE INTO {table_name} VALUES ({'?,' * (column_number - 1) + '?'})", row)
-        connection.commit()
-        connection.close()
-        return return_codes['OK']
-    except Exception:
-        return return_codes['Error']
+    # columns of the table structures that are tracked in price_history
+    tracked_columns = {'Цена': 'price', 'Скидка': 'discount', 'Итого': 'final_price', 'Рейтинг': 'rating',
+                       'Наличие': 'availability'}
+
+    def __init__(self, table_structure, shop_name, indexes=(), batch_size=500, db_path=database_path,
+                 checkpoint=None):
+        """
+        Makes history tables if they do not exist and loads the last known state of the shop's products
+
+        :param table_structure: A list of fields in a format of (name, type, modifiers).
+        If modifiers are passed they must start with a space
+        :param shop_name: Name of the target shop
+        :param indexes: Not used, history tables have their own indexes
+        :param batch_size: Amount of buffered changes that triggers a write into the database
+        :param db_path: Path to the sqlite3 database file
+        :param checkpoint: Checkpoint of the parse
+        """
+
+        self.shop_name = shop_name
+        self.table_name = 'products'
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.columns = [get_column_name(field) for field in table_structure]
+        self.key_index = get_key_index(table_structure)
+        self.tracked_indexes = [self.columns.index(column) if column in self.columns else None
+                                for column in self.tracked_columns]
+        self.name_index = self.columns.index('Название')
+        self.data_indexes = [i for i in range(len(self.columns)) if i != self.key_index and i != self.name_index
+                             and i not in self.tracked_indexes and self.columns[i] not in history_ignored_columns]
+        self.products = []
+        self.history = []
+        # amounts of buffered changes that belong to completed pages and numbers of those pages
+        self.completed_changes = (0, 0)
+        self.completed_pages = []
+        self.connection = get_connection(db_path)
+        create_history_tables(self.connection)
+        if checkpoint is not None:
+            create_checkpoint_tables(self.connection)
+            if not checkpoint.resumed:
+                checkpoint.start(self.table_name)
+        self.state = {}
+        for code, *state in self.connection.execute(
+                'SELECT code, price, discount, final_price, rating, availability, name, data FROM products '
+                'WHERE shop = ?', (shop_name,)):
+            self.state[code] = tuple(state)
+        atexit.register(self.close)
+
+    def save(self, row):
+        """
+        Buffers given row if the product is new or changed and writes the buffer once it is full
+
+        :param row: Row must be a tuple with elements in the same order as in the table structure
+        :return:
+        """
+
+        code = str(row[self.key_index])
+        tracked = tuple(None if i is None else row[i] for i in self.tracked_indexes)
+        data = json.dumps({self.columns[i]: row[i] for i in self.data_indexes}, ensure_ascii=False)
+        state = tracked + (row[self.name_index], data)
+        previous_state = self.state.get(code)
+        if previous_state == state:
+            return
+        now = datetime.today().isoformat(timespec='seconds')
+        self.state[code] = state
+        self.products.append((self.shop_name, code) + state + (now, now))
+        if previous_state is None or previous_state[:len(tracked)] != tracked:
+            self.history.append((self.shop_name, code, now) + tracked)
+        if len(self.products) >= self.batch_size:
+            self.flush()
+
+    def complete_page(self, page_number):
+        """
+        Marks all buffered changes as changes of completed pages. Without a checkpoint does nothing
+
+        :param page_number: Number of the page whose rows were all saved
+        :return:
+        """
+
+        if self.checkpoint is None:
+            return
+        self.completed_changes = (len(self.products), len(self.history))
+        self.completed_pages.append(page_number)
+
+    def flush(self):
+        """
+        Writes all buffered changes into the database in one transaction. With a checkpoint changes of a page
+        that is not completed yet stay in the buffer
+
+        :return:
+        """
+
+        if self.connection is None:
+            return
+        if self.checkpoint is None:
+            products, history = self.products, self.history
+        else:
+            products, history = self.products[:self.completed_changes[0]], self.history[:self.completed_changes[1]]
+        if not products and not self.completed_pages:
+            return
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO products VALUES (?,?,?,?,?,?,?,?,?,?,?) ON CONFLICT (shop, code) DO UPDATE SET '
+                'price = excluded.price, discount = excluded.discount, final_price = excluded.final_price, '
+                'rating = excluded.rating, availability = excluded.availability, name = excluded.name, '
+                'data = excluded.data, last_changed = excluded.last_changed', products)
+            self.connection.executemany('INSERT INTO price_history VALUES (?,?,?,?,?,?,?,?)', history)
+            if self.completed_pages:
+                self.checkpoint.save_pages(self.connection, self.completed_pages)
+        if self.completed_pages:
+            self.checkpoint.commit_pages(self.completed_pages)
+        del self.products[:len(products)]
+        del self.history[:len(history)]
+        self.completed_changes = (0, 0)
+        self.completed_pages = []
+
+    def close(self):
+        """
+        Writes remaining changes and closes the connection. Safe to call more than once.
+        With a checkpoint changes of a page that is not completed are dropped, the page is parsed again on resume
+
+        :return:
+        """
+
+        if self.connection is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self.connection.close()
+            self.connection = None
+            atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class FileSink:
+    """
+    Base class of sinks that stream rows into compressed files. Starts a new file once the current one
+    reaches max_file_size bytes, so memory usage does not depend on the size of the catalog.
+    Progress of file sinks is not checkpointed, so their parses can not be resumed
+    """
+
+    extension = ''
+
+    def __init__(self, table_structure, shop_name, indexes=(), compression='gzip', max_file_size=64 * 1024 * 1024,
+                 directory=results_directory, checkpoint=None):
+        """
+        Makes a sink for the current parse. Files are named '{shop_name}_{date}_{part}{extension}'
+
+        :param table_structure: A list of fields in a format of (name, type, modifiers).
+        If modifiers are passed they must start with a space
+        :param shop_name: Name of the target shop
+        :param indexes: Not used, files have no indexes
+        :param compression: 'gzip' or 'zstd'. zstd requires zstandard package
+        :param max_file_size: Size of a compressed file in bytes after which a new file is started
+        :param directory: Directory for the result files
+        :param checkpoint: Not used, file sinks can not be resumed
+        """
+
+        if compression not in compressions:
+            raise ValueError(f'Unsupported compression: {compression}')
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('zstandard package is required for zstd compression')
+        if checkpoint is not None and checkpoint.resumed:
+            raise ValueError('Parses saved into files can not be resumed')
+        self.table_name = get_table_name(shop_name)
+        self.columns = [get_column_name(field) for field in table_structure]
+        self.compression = compression
+        self.max_file_size = max_file_size
+        self.directory = directory
+        self.part = 0
+        self.raw_file = None
+        self.compressed_file = None
+        self.file = None
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(self.close)
+
+    def open_file(self):
+        """
+        Starts the next result file
+
+        :return:
+        """
+
+        self.part += 1
+        file_name = f'{self.table_name}_{self.part:04}{self.extension}{compressions[self.compression]}'
+        # names are unique, a file of another parse is never overwritten
+        self.raw_file = open(os.path.join(self.directory, file_name), 'xb')
+        if self.compression == 'gzip':
+            self.compressed_file = gzip.GzipFile(fileobj=self.raw_file, mode='wb')
+        else:
+            self.compressed_file = zstandard.ZstdCompressor().stream_writer(self.raw_file)
+        self.file = io.TextIOWrapper(self.compressed_file, encoding='utf-8', newline='')
+        self.write_header()
+
+    def close_file(self):
+        """
+        Finishes the current result file
+
+        :return:
+        """
+
+        if self.file is None:
+            return
+        self.file.close()
+        if not self.raw_file.closed:
+            self.raw_file.close()
+        self.raw_file = None
+        self.compressed_file = None
+        self.file = None
+
+    def write_header(self):
+        pass
+
+    def write_row(self, row):
+        raise NotImplementedError
+
+    def save(self, row):
+        """
+        Writes given row into the current file and starts a new one if it is full
+
+        :param row: Row must be a tuple with elements in the same order as in the table
+        :return:
+        """
+
+        if self.file is None:
+            self.open_file()
+        self.write_row(row)
+        if self.raw_file.tell() >= self.max_file_size:
+            self.close_file()
+
+    def complete_page(self, page_number):
+        pass
+
+    def flush(self):
+        """
+        Passes written rows to the compressor
+
+        :return:
+        """
+
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        """
+        Finishes the current file. Safe to call more than once
+
+        :return:
+        """
+
+        self.close_file()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class JsonlSink(FileSink):
+    """
+    Streams rows into compressed JSON Lines files, one object per product
+    """
+
+    extension = '.jsonl'
+
+    def write_row(self, row):
+        self.file.write(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + '\n')
+
+
+class CsvSink(FileSink):
+    """
+    Streams rows into compressed CSV files. Every file starts with a header
+    """
+
+    extension = '.csv'
+
+    def write_header(self):
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.columns)
+
+    def write_row(self, row):
+        self.writer.writerow(row)
 
 
 # currently supported save options
-save_options = {'.db': db_save}
+save_options = {'.db': DbSink,
+                '.history': HistorySink,
+                '.jsonl.gz': partial(JsonlSink, compression='gzip'),
+                '.jsonl.zst': partial(JsonlSink, compression='zstd'),
+                '.csv.gz': partial(CsvSink, compression='gzip'),
+                '.csv.zst': partial(CsvSink, compression='zstd')}
+
+
+def check_partial_parse(save_option, option_name):
+    """
+    Checks that pages can be skipped with the save option, e.g. by revalidation or by an incremental parse.
+    Only '.history' keeps products of earlier parses, a snapshot would miss every product of a skipped page
+
+    :param save_option: Must be one of the values from 'save_options' dict
+    :param option_name: Name of the option that skips pages, used in the error
+    :return:
+    """
 
+    if save_option is not save_options['.history']:
+        raise ValueError(f'{option_name} can only be used with the .history save option')
 
-def create_table(table_structure, shop_name):
+
+def get_connection(db_path=database_path):
+    """
+    Opens a connection to the sqlite3 database in WAL mode
+
+    :param db_path: Path to the sqlite3 database file
+    :return: connection
+    :rtype: sqlite3.Connection
+    """
+
+    connection = sqlite3.connect(db_path, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+def get_table_name(shop_name):
+    """
+    Makes a unique name for the results of the current parse. The name ends with a random run id, so parses
+    started in the same second get different tables and files
+
+    :param shop_name: Name of the target shop
+    :return: table name in a format of '{shop name}_{date}_{run id}'
+    :rtype: str
+    """
+
+    date = datetime.today().strftime(table_date_format)
+    return f'{shop_name}_{date}_{uuid.uuid4().hex[:8]}'
+
+
+def get_column_name(field):
+    """
+    Gets a column name without sql brackets from a table structure field
+
+    :param field: Field in a format of (name, type, modifiers)
+    :return: column name
+    :rtype: str
+    """
+
+    return field[0].strip('[]')
+
+
+def get_upsert_query(table_name, table_structure):
+    """
+    Gets the query that saves a row into a table. A product can be saved twice when it moves to another page
+    during the parse. If the table has a popularity column, the row with the best (lowest) rank is kept,
+    otherwise the row saved last replaces the previous one
+
+    :param table_name: Name of the table
+    :param table_structure: A list of fields in a format of (name, type, modifiers)
+    :return: sql query with a placeholder for every column
+    :rtype: str
+    """
+
+    placeholders = '?,' * (len(table_structure) - 1) + '?'
+    columns = [get_column_name(field) for field in table_structure]
+    key_field = table_structure[get_key_index(table_structure)]
+    rank_column = next((column for column in columns if column in history_ignored_columns), None)
+    # upsert needs a unique key, 'INSERT or REPLACE' works without one
+    if rank_column is None or 'UNIQUE' not in (key_field[2] if len(key_field) > 2 else '').upper():
+        return f"INSERT or REPLACE INTO {table_name} VALUES ({placeholders})"
+    updates = ', '.join(f'[{column}] = excluded.[{column}]' for column in columns)
+    # a page saved again has the same ranks and refreshes its rows
+    return f"INSERT INTO {table_name} VALUES ({placeholders}) ON CONFLICT ([{get_column_name(key_field)}]) " \
+           f"DO UPDATE SET {updates} WHERE excluded.[{rank_column}] <= {table_name}.[{rank_column}]"
+
+
+def get_key_index(table_structure):
+    """
+    Gets the index of the column that identifies a product: its code on the site or its article
+
+    :param table_structure: A list of fields in a format of (name, type, modifiers)
+    :return: column index
+    :rtype: int
+    """
+
+    columns = [get_column_name(field) for field in table_structure]
+    return columns.index('Код товара на сайте' if 'Код товара на сайте' in columns else 'Артикул')
+
+
+def create_history_tables(connection):
+    """
+    Makes 'products' and 'price_history' tables if they do not exist
+
+    :param connection: Connection to the sqlite3 database
+    :return:
+    """
+
+    with connection:
+        connection.execute('CREATE TABLE IF NOT EXISTS products (shop TEXT NOT NULL, code TEXT NOT NULL, '
+                           'price, discount, final_price, rating, availability, name TEXT, data TEXT, '
+                           'first_seen TEXT, last_changed TEXT, PRIMARY KEY (shop, code))')
+        connection.execute('CREATE TABLE IF NOT EXISTS price_history (shop TEXT NOT NULL, code TEXT NOT NULL, '
+                           'recorded_at TEXT NOT NULL, price, discount, final_price, rating, availability)')
+        connection.execute('CREATE INDEX IF NOT EXISTS price_history_product '
+                           'ON price_history (shop, code, recorded_at)')
+
+
+def create_table(table_structure, shop_name, db_path=database_path, indexes=()):
     """
     Makes a table for the current parse from the given table structure
 
     :param table_structure: A list of fields in a format of (name, type, modifiers).
     If modifiers are passed they must start with a space
     :param shop_name: Name of the target shop
+    :param db_path: Path to the sqlite3 database file
+    :param indexes: A list of secondary indexes in a format of (column, ...)
     :return: table name
     :rtype: str
     """
 
-    date = datetime.today().strftime('%d_%m_%Y_%H_%M')
-    table_name = f'{shop_name}_{date}'
-    connection = sqlite3.connect('../ParsingResults.db')
+    table_name = get_table_name(shop_name)
+    connection = get_connection(db_path)
     cursor = connection.cursor()
     str_table_structure = get_str_table_struct(table_structure)
     cursor.execute(f"""CREATE TABLE {table_name} ({str_table_structure});""")
+    for query in get_str_index_queries(table_name, indexes):
+        cursor.execute(query)
     connection.commit()
     connection.close()
     return table_name
 
 
-def save_row(row, table_name, save_option, table_structure):
+def open_sink(save_option, table_structure, shop_name, indexes=(), **kwargs):
     """
-    Main saving function. Save a row into the correct format depending on save_option.
+    Makes a sink for the current parse. Must be used as a context manager so that buffered rows are saved
+    even if the parse crashes
 
-    :param row: Row must be a tuple with elements in the same order as in the table
-    :param table_name: If saving into sql db, must be a name of an existing table in the database
     :param save_option: Must be one of the values from 'save_options' dict
     :param table_structure: A list of fields in a format of (name, type, modifiers).
     If modifiers are passed they must start with a space
+    :param shop_name: Name of the target shop
+    :param indexes: A list of secondary indexes in a format of (column, ...)
+    :param kwargs: Additional sink settings, e.g. batch_size
+    :return: sink
+    """
+
+    return save_option(table_structure, shop_name, indexes, **kwargs)
+
+
+def save_row(row, sink):
+    """
+    Main saving function. Save a row into the correct format depending on the sink made by 'open_sink'.
+
+    :param row: Row must be a tuple with elements in the same order as in the table
+    :param sink: Sink of the current parse
+    :return: returns one of the return codes from core
+    :raises WriterError: if the writer thread of a queued sink failed to save earlier rows
+    """
+
+    try:
+        sink.save(row)
+        return return_codes['OK']
+    except WriterError:
+        raise
+    except Exception:
+        return return_codes['Error']
+
+
+def save_rows(rows, sink, seen=None, key_index=None):
+    """
+    Saves rows of a page, e.g. rows made by a parse stage of 'crawl_pages'
+
+    :param rows: Rows in the same order as in the table. If None, nothing is saved
+    :param sink: Sink of the current parse
+    :param seen: Seen set of the parse from 'get_seen_set'. Rows of products seen earlier are skipped
+    :param key_index: Index of the column that identifies a product, from 'get_key_index'. Required with seen
     :return:
     """
 
-    if save_option == save_options['.db']:
-        save_option(row, table_name, len(table_structure))
+    if rows is None:
+        return
+    for row in rows:
+        if seen is None or seen.add(row[key_index]):
+            save_row(row, sink)
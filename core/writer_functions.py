@@ -0,0 +1,186 @@
+from contextlib import nullcontext
+import queue
+import threading
+
+# commands passed through the writer queue instead of rows
+_FLUSH = object()
+_CLOSE = object()
+_STOP = object()
+
+
+class _CompletedPage:
+    """
+    Command passed through the writer queue after all rows of a page, so the sink gets it in order with the rows
+    """
+
+    __slots__ = ('page_number',)
+
+    def __init__(self, page_number):
+        self.page_number = page_number
+
+
+class WriterError(Exception):
+    """
+    Raised in the parsing thread when the writer thread failed to save some rows
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f'{len(errors)} write error(s), first one: {errors[0][1]!r}')
+
+
+class RowWriter:
+    """
+    Saves rows on a dedicated thread so that fetching does not wait for the database.
+    Rows are passed through a bounded queue: when it is full the parsing thread waits for the writer
+    """
+
+    def __init__(self, maxsize=1000):
+        """
+        Starts the writer thread
+
+        :param maxsize: Maximum amount of rows waiting to be saved
+        """
+
+        self.queue = queue.Queue(maxsize)
+        self.errors = []
+        self.errors_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='RowWriter', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                sink, row = item
+                if row is _FLUSH:
+                    sink.flush()
+                elif row is _CLOSE:
+                    sink.close()
+                elif type(row) is _CompletedPage:
+                    sink.complete_page(row.page_number)
+                else:
+                    sink.save(row)
+            except Exception as error:
+                with self.errors_lock:
+                    self.errors.append((sink, error))
+            finally:
+                self.queue.task_done()
+
+    def check(self, sink=None):
+        """
+        Raises errors that happened in the writer thread since the last check
+
+        :param sink: If passed, only errors of this sink are raised, so parsers sharing the writer do not get
+        errors of each other
+        :return:
+        """
+
+        with self.errors_lock:
+            errors = [error for error in self.errors if sink is None or error[0] is sink]
+            if not errors:
+                return
+            self.errors = [error for error in self.errors if sink is not None and error[0] is not sink]
+        raise WriterError(errors) from errors[0][1]
+
+    def put(self, sink, row):
+        """
+        Queues a row to be saved into the given sink. Waits if the queue is full
+
+        :param sink: Sink made by 'open_sink'
+        :param row: Row must be a tuple with elements in the same order as in the table
+        :return:
+        """
+
+        self.check(sink)
+        self.queue.put((sink, row))
+
+    def join(self, sink=None):
+        """
+        Waits until every queued row is processed
+
+        :param sink: If passed, only errors of this sink are raised
+        :return:
+        """
+
+        self.queue.join()
+        self.check(sink)
+
+    def attach(self, sink):
+        """
+        Wraps a sink so that rows saved into it go through the writer thread
+
+        :param sink: Sink made by 'open_sink'
+        :return: queued sink
+        :rtype: QueuedSink
+        """
+
+        return QueuedSink(self, sink)
+
+    def close(self):
+        """
+        Saves all queued rows and stops the writer thread
+
+        :return:
+        """
+
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join()
+        self.check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class QueuedSink:
+    """
+    Sink that passes rows to a RowWriter. Has the same interface as the sinks from 'save_options'
+    """
+
+    def __init__(self, writer, sink):
+        self.writer = writer
+        self.sink = sink
+
+    def __getattr__(self, item):
+        return getattr(self.sink, item)
+
+    def save(self, row):
+        self.writer.put(self.sink, row)
+
+    def complete_page(self, page_number):
+        self.writer.put(self.sink, _CompletedPage(page_number))
+
+    def flush(self):
+        self.writer.put(self.sink, _FLUSH)
+        self.writer.join(self.sink)
+
+    def close(self):
+        # the sink must be closed even if earlier rows failed, so the queue is used without a check
+        self.writer.queue.put((self.sink, _CLOSE))
+        self.writer.join(self.sink)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def use_writer(writer=None):
+    """
+    Gets a context manager of a writer for one parse. A passed writer is shared with other parses, so it is not
+    closed at the end of the parse
+
+    :param writer: Shared RowWriter. A new writer is made if None
+    :return: context manager that gives the writer
+    """
+
+    if writer is None:
+        return RowWriter()
+    return nullcontext(writer)
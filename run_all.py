@@ -0,0 +1,116 @@
+from collections import defaultdict
+import argparse
+import queue
+import threading
+import traceback
+from core import save_options, use_writer
+from settings import shop_job_limits
+from DetMir import DetMir_ParserMain
+from MyShop import MyShop_ParserMain
+from Ozon import Ozon_ParserMain
+from WildBerries import WildBerries_ParserMain
+
+# main functions of the parsers in a format of {shop name: run_parser}
+parsers = {'WildBerries': WildBerries_ParserMain.run_parser, 'MyShop': MyShop_ParserMain.run_parser,
+           'DetMir': DetMir_ParserMain.run_parser, 'Ozon': Ozon_ParserMain.run_parser}
+
+
+def load_jobs(path, default_save_option='.db'):
+    """
+    Reads a job file. Every line of the file is a job in the form of '<shop name> <listing url> [save option]'.
+    Empty lines and lines starting with '#' are skipped
+
+    :param path: Path to the job file
+    :param default_save_option: Key of 'save_options' used by jobs without a save option
+    :return: jobs in a format of (shop name, url, save option key)
+    :rtype: list
+    """
+
+    jobs = []
+    with open(path, encoding='utf-8') as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.split()
+            if len(fields) not in (2, 3) or fields[0] not in parsers:
+                raise ValueError(f'Wrong job on line {line_number} of {path}: {line}')
+            save_option = fields[2] if len(fields) == 3 else default_save_option
+            if save_option not in save_options:
+                raise ValueError(f'Unknown save option on line {line_number} of {path}: {save_option}')
+            jobs.append((fields[0], fields[1], save_option))
+    return jobs
+
+
+def run_jobs(jobs, job_limits=None, **parser_kwargs):
+    """
+    Runs jobs of all shops concurrently in one process. Every shop gets its own workers, so a shop with many
+    jobs does not hold back the others. All jobs share one writer, the shops' sessions and the rate limiter
+
+    :param jobs: Jobs in a format of (shop name, url, save option key)
+    :param job_limits: Maximum amount of simultaneous jobs of every shop in a format of {shop name: amount}.
+    Shops without a limit use 'shop_job_limits' from settings
+    :param parser_kwargs: Arguments passed to every 'run_parser', e.g. concurrency
+    :return: failed jobs in a format of (shop name, url, save option key)
+    :rtype: list
+    """
+
+    job_limits = {**shop_job_limits, **(job_limits or {})}
+    shop_queues = defaultdict(queue.Queue)
+    for job in jobs:
+        shop_queues[job[0]].put(job)
+    failed = []
+
+    def work(shop_queue, writer):
+        while True:
+            try:
+                shop_name, url, save_option = shop_queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                parsers[shop_name](url, save_options[save_option], writer=writer, **parser_kwargs)
+            except Exception:
+                traceback.print_exc()
+                failed.append((shop_name, url, save_option))
+
+    with use_writer() as writer:
+        threads = [threading.Thread(target=work, args=(shop_queue, writer), name=f'{shop_name}-{i}')
+                   for shop_name, shop_queue in shop_queues.items()
+                   for i in range(min(job_limits.get(shop_name, 1), shop_queue.qsize()))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs parsers of several shops concurrently')
+    parser.add_argument('job_file', help="file with jobs in the form of '<shop name> <listing url> [save option]'")
+    parser.add_argument('--save-option', default='.db', choices=list(save_options),
+                        help='save option of jobs without one')
+    parser.add_argument('--concurrency', type=int, default=1, help='simultaneously fetched pages of a job')
+    parser.add_argument('--per-host', type=int, help='simultaneous requests of a job to one host')
+    parser.add_argument('--limit', action='append', default=[], metavar='SHOP=N',
+                        help='maximum amount of simultaneous jobs of a shop')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue unfinished jobs from their last saved page into the same tables')
+    parser.add_argument('--incremental', action='store_true',
+                        help='stop jobs early on pages that did not change since the previous parse. '
+                             'Jobs must use the .history save option')
+    args = parser.parse_args()
+
+    job_limits = {}
+    for limit in args.limit:
+        shop_name, amount = limit.split('=')
+        job_limits[shop_name] = int(amount)
+    jobs = load_jobs(args.job_file, args.save_option)
+    failed = run_jobs(jobs, job_limits, concurrency=args.concurrency, resume=args.resume,
+                      incremental=args.incremental, per_host=args.per_host)
+    for shop_name, url, save_option in failed:
+        print(f'Ошибка: {shop_name} {url}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
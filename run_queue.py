@@ -0,0 +1,135 @@
+import argparse
+import multiprocessing
+import socket
+from core import save_options, open_sink, create_table, DiskCache, SqliteTaskQueue, work, queue_path
+from settings import wildberries_table_structure, wildberries_table_indexes, myshop_table_structure, \
+    myshop_table_indexes, detmir_table_structure, detmir_table_indexes, ozon_table_structure, ozon_table_indexes
+from run_all import load_jobs
+from DetMir import DetMir_ParserMain
+from MyShop import MyShop_ParserMain
+from Ozon import Ozon_ParserMain
+from WildBerries import WildBerries_ParserMain
+
+# parsers and tables of the shops in a format of {shop name: (parser module, table structure, table indexes)}
+shops = {'WildBerries': (WildBerries_ParserMain, wildberries_table_structure, wildberries_table_indexes),
+         'MyShop': (MyShop_ParserMain, myshop_table_structure, myshop_table_indexes),
+         'DetMir': (DetMir_ParserMain, detmir_table_structure, detmir_table_indexes),
+         'Ozon': (Ozon_ParserMain, ozon_table_structure, ozon_table_indexes)}
+
+# save options that workers can share. A product saved twice keeps one row instead of being duplicated,
+# file sinks can not do that
+queue_save_options = ('.db', '.history')
+
+
+def enqueue_jobs(task_queue, jobs):
+    """
+    Coordinator of a distributed parse. Counts pages of every job, saves the rows of the first page, which is
+    downloaded to count pages, and adds a task for every other page. Every job gets its own table
+
+    :param task_queue: TaskQueue shared with the workers
+    :param jobs: Jobs in a format of (shop name, url, save option key)
+    :return: amount of added tasks
+    :rtype: int
+    """
+
+    task_amount = 0
+    with DiskCache('MyShop_details') as myshop_cache:
+        for shop_name, url, save_option in jobs:
+            if save_option not in queue_save_options:
+                raise ValueError(f'Save option {save_option} can not be used by workers')
+            module, table_structure, table_indexes = shops[shop_name]
+            session = module.get_session(url)
+            # MyShop counts pages by the url of the list, the other parsers by the url of the first page
+            page_amount, first_page = module.get_page_amount(
+                url if shop_name == 'MyShop' else module.get_url(url, 1), session)
+            if save_option == '.db':
+                table_name = create_table(table_structure, shop_name, indexes=table_indexes)
+                sink_kwargs = {'table_name': table_name}
+            else:
+                table_name = 'products'
+                sink_kwargs = {}
+            page_kwargs = {'cache': myshop_cache} if shop_name == 'MyShop' else {}
+            with open_sink(save_options[save_option], table_structure, shop_name, table_indexes,
+                           **sink_kwargs) as sink:
+                module.parse_page(url, 1, sink, session, page_data=first_page, **page_kwargs)
+            task_queue.add({'shop': shop_name, 'url': url, 'page': page_number, 'save_option': save_option,
+                            'table_name': table_name} for page_number in range(2, page_amount + 1))
+            task_amount += page_amount - 1
+            print(f'{shop_name} {url}: {page_amount} страниц, таблица {table_name}')
+    return task_amount
+
+
+def run_worker(worker, db_path=queue_path, lease_time=300):
+    """
+    Worker of a distributed parse. Parses pages from the queue and saves their rows until every task is done
+    or failed. Rows of a page are written before its task is completed, so a crashed worker loses no rows
+
+    :param worker: Name of the worker
+    :param db_path: Path to the sqlite3 database file of the queue
+    :param lease_time: Seconds a worker has for a page before it is given to another worker
+    :return:
+    """
+
+    sessions = {}
+    sinks = {}
+    with SqliteTaskQueue(db_path) as task_queue, DiskCache('MyShop_details') as myshop_cache:
+
+        def run_task(task):
+            shop_name = task['shop']
+            module, table_structure, table_indexes = shops[shop_name]
+            if shop_name not in sessions:
+                sessions[shop_name] = module.get_session(task['url'])
+            sink_key = (shop_name, task['save_option'], task['table_name'])
+            if sink_key not in sinks:
+                sink_kwargs = {'table_name': task['table_name']} if task['save_option'] == '.db' else {}
+                sinks[sink_key] = open_sink(save_options[task['save_option']], table_structure, shop_name,
+                                            table_indexes, **sink_kwargs)
+            page_kwargs = {'cache': myshop_cache} if shop_name == 'MyShop' else {}
+            module.parse_page(task['url'], task['page'], sinks[sink_key], sessions[shop_name], **page_kwargs)
+            sinks[sink_key].flush()
+
+        try:
+            completed = work(task_queue, run_task, worker, lease_time)
+        finally:
+            for sink in sinks.values():
+                sink.close()
+    print(f'{worker}: выполнено задач: {completed}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parses shops with workers that share a task queue')
+    parser.add_argument('--queue', default=queue_path, help='path to the database of the queue')
+    commands = parser.add_subparsers(dest='command', required=True)
+    enqueue_parser = commands.add_parser('enqueue', help='add a task for every page of the jobs')
+    enqueue_parser.add_argument('job_file', help="file with jobs in the form of '<shop name> <listing url> "
+                                                 "[save option]'")
+    enqueue_parser.add_argument('--save-option', default='.db', choices=queue_save_options,
+                                help='save option of jobs without one')
+    work_parser = commands.add_parser('work', help='run workers until the queue is finished')
+    work_parser.add_argument('--processes', type=int, default=2, help='amount of worker processes')
+    work_parser.add_argument('--lease-time', type=float, default=300,
+                             help='seconds a worker has for a page before it is given to another worker')
+    commands.add_parser('status', help='show amounts of tasks and failed tasks')
+    args = parser.parse_args()
+
+    if args.command == 'enqueue':
+        with SqliteTaskQueue(args.queue) as task_queue:
+            enqueue_jobs(task_queue, load_jobs(args.job_file, args.save_option))
+    elif args.command == 'work':
+        host = socket.gethostname()
+        workers = [multiprocessing.Process(target=run_worker, args=(f'{host}-{i}', args.queue, args.lease_time))
+                   for i in range(args.processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    with SqliteTaskQueue(args.queue) as task_queue:
+        print(task_queue.get_counts())
+        failed = task_queue.get_failed()
+    for task_id, task, error in failed:
+        print(f'Ошибка: {task["shop"]} {task["url"]} страница {task["page"]}: {error}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,2 +1,3 @@
 from .database_settings import *
 from .header_settings import *
+from .session_settings import *
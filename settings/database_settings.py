@@ -1,46 +1,55 @@
 wildberries_table_structure = [('Брэнд', 'STRING', ''),
                                ('Название', 'STRING', ''),
-                               ('Цена', 'STRING', ''),
-                               ('Скидка', 'STRING', ''),
-                               ('Итого', 'STRING', ''),
-                               ('[Популярность рейтинг]', 'STRING', ''),
-                               ('Рейтинг', 'STRING', ''),
-                               ('[Кол-во отзывов]', 'STRING', ''),
+                               ('Цена', 'INTEGER', ''),
+                               ('Скидка', 'INTEGER', ''),
+                               ('Итого', 'INTEGER', ''),
+                               ('[Популярность рейтинг]', 'INTEGER', ''),
+                               ('Рейтинг', 'REAL', ''),
+                               ('[Кол-во отзывов]', 'INTEGER', ''),
                                ('[Обложка товара]', 'STRING', ''),
                                ('Артикул', 'STRING', ' UNIQUE NOT NULL')]
 
 myshop_table_structure = [('Брэнд', 'STRING', ''),
                           ('Название', 'STRING', ''),
                           ('Серия', 'STRING', ''),
-                          ('Цена', 'STRING', ''),
-                          ('Скидка', 'STRING', ''),
-                          ('Итого', 'STRING', ''),
-                          ('Популярность', 'STRING', ''),
+                          ('Цена', 'INTEGER', ''),
+                          ('Скидка', 'INTEGER', ''),
+                          ('Итого', 'INTEGER', ''),
+                          ('Популярность', 'INTEGER', ''),
                           ('[Обложка товара]', 'STRING', ''),
                           ('Артикул', 'STRING', ' UNIQUE NOT NULL'),
                           ('ISBN', 'STRING', '')]
 
 detmir_table_structure = [('Название', 'STRING', ''),
-                          ('Цена', 'STRING', ''),
-                          ('Скидка', 'STRING', ''),
-                          ('Итого', 'STRING', ''),
-                          ('Популярность', 'STRING', ''),
-                          ('Рейтинг', 'STRING', ''),
-                          ('[Колво отзывов]', 'STRING', ''),
+                          ('Цена', 'INTEGER', ''),
+                          ('Скидка', 'INTEGER', ''),
+                          ('Итого', 'INTEGER', ''),
+                          ('Популярность', 'INTEGER', ''),
+                          ('Рейтинг', 'REAL', ''),
+                          ('[Колво отзывов]', 'INTEGER', ''),
                           ('[Обложка товара]', 'STRING', ''),
                           ('[Код товара на сайте]', 'STRING', ' UNIQUE NOT NULL'),
                           ('Артикул', 'STRING', ''),
                           ('Наличие', 'STRING', '')]
 
 ozon_table_structure = [('Название', 'STRING', ''),
-                        ('Цена', 'STRING', ''),
-                        ('Скидка', 'STRING', ''),
-                        ('Итого', 'STRING', ''),
-                        ('Популярность', 'STRING', ''),
+                        ('Цена', 'INTEGER', ''),
+                        ('Скидка', 'INTEGER', ''),
+                        ('Итого', 'INTEGER', ''),
+                        ('Популярность', 'INTEGER', ''),
                         ('[Тип товара]', 'STRING', ''),
-                        ('Рейтинг', 'STRING', ''),
-                        ('[Колво отзывов]', 'STRING', ''),
+                        ('Рейтинг', 'REAL', ''),
+                        ('[Колво отзывов]', 'INTEGER', ''),
                         ('[Обложка товара]', 'STRING', ''),
                         ('[Код товара на сайте]', 'STRING', ' UNIQUE NOT NULL'),
                         ('Артикул', 'STRING', ''),
                         ('Наличие', 'STRING', '')]
+
+# secondary indexes of the tables in a format of (column, ...)
+wildberries_table_indexes = [('Итого',), ('Брэнд', 'Итого')]
+
+myshop_table_indexes = [('Итого',), ('Брэнд', 'Итого')]
+
+detmir_table_indexes = [('Итого',), ('Артикул',)]
+
+ozon_table_indexes = [('Итого',), ('Артикул',)]
@@ -0,0 +1,17 @@
+# (connect, read) timeouts of the shops' requests in seconds
+WildBerries_timeout = (3.05, 10)
+
+MyShop_timeout = (3.05, 10)
+
+DetMir_timeout = (3.05, 15)
+
+Ozon_timeout = (3.05, 10)
+
+# maximum amount of simultaneous jobs of a shop in 'run_all', so one shop can not take all the workers
+shop_job_limits = {'WildBerries': 2, 'MyShop': 2, 'DetMir': 1, 'Ozon': 1}
+
+# incremental parses stop after that many consecutive pages equal to the previous parse
+incremental_stop_pages = 3
+
+# incremental parses still parse every page if the last full parse is older than that many seconds
+full_parse_interval = 24 * 60 * 60
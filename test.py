@@ -2,16 +2,16 @@
 
 import nordvpn_switcher as ns
 from random_user_agent.user_agent import UserAgent
-from settings import ChitaiGorod_headers
-from DetMir import get_json_data
-from core import write_dict, get_new_headers, get_new_session, user_agent_rotator
+from settings import ChitaiGorod_headers, YandexMarket_headers
+from core import write_dict, get_new_headers, get_new_session, user_agent_rotator, solve_challenge
 from bs4 import BeautifulSoup
-import cfscrape
 
 
 target_url = "https://market.yandex.ru/catalog--mobilnye-telefony/54726/list?hid=91491&cpa=0&onstock=1&local-offers-first=0"   # replace url with anti-bot protected website
-scraper = cfscrape.create_scraper()
-html_text = scraper.get(target_url).text
+# clearance cookies are saved, so the challenge is solved only when they expire or are rejected
+session = get_new_session(target_url, get_new_headers(YandexMarket_headers, user_agent_rotator),
+                          state_key='YandexMarket', warm_up=solve_challenge)
+html_text = session.get(target_url).text
 parsed_html = BeautifulSoup(html_text, 'html.parser')
 with open('output.txt', 'w') as file:
     file.write(parsed_html.prettify())
@@ -0,0 +1,89 @@
+import csv
+import sqlite3
+import pytest
+from core import get_price_report, export_report
+from core.analytics_functions import get_snapshot_tables
+from core.checkpoint_functions import create_checkpoint_tables
+
+# reports are made with numpy
+pytest.importorskip('numpy')
+
+
+def make_snapshot(db_path, table_name, products):
+    """
+    Makes a snapshot table like 'create_table' does, without a unique code as in older parses
+
+    :param products: Products in a format of [(code, final price, discount, popularity)]
+    """
+
+    with sqlite3.connect(db_path) as connection:
+        connection.execute(f'CREATE TABLE {table_name} (Название STRING, Итого INTEGER, Скидка INTEGER, '
+                           f'Популярность INTEGER, [Код товара на сайте] STRING)')
+        connection.executemany(f'INSERT INTO {table_name} VALUES (?, ?, ?, ?, ?)',
+                                [('Товар', price, discount, popularity, code)
+                                 for code, price, discount, popularity in products])
+
+
+def test_consecutive_snapshots_are_compared(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    make_snapshot(db_path, 'DetMir_01_02_2024_10_00_00_aaaaaaaa',
+                  [('a', 100, 0, 1), ('b', 100, 0, 2), ('c', 100, 0, 3)])
+    make_snapshot(db_path, 'DetMir_02_02_2024_10_00_00_bbbbbbbb',
+                  [('a', 90, 10, 1), ('b', 100, 0, 2), ('d', 50, None, 3)])
+    (old_table, new_table, report), = get_price_report('DetMir', db_path=db_path, chunk_size=2)
+    assert (old_table, new_table) == ('DetMir_01_02_2024_10_00_00_aaaaaaaa', 'DetMir_02_02_2024_10_00_00_bbbbbbbb')
+    assert report['Код'].tolist() == ['a']
+    assert report['Изменение цены'].tolist() == [-10]
+    assert report['Скидка после'].tolist() == [10]
+    assert report['new'].tolist() == ['d']
+    assert report['removed'].tolist() == ['c']
+
+
+def test_first_row_of_a_duplicate_code_is_kept(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    make_snapshot(db_path, 'DetMir_01_02_2024_10_00_00_aaaaaaaa', [('a', 100, 0, 1), ('b', 100, 0, 2)])
+    # 'a' moved to a later page while the list was parsed and was saved twice
+    make_snapshot(db_path, 'DetMir_02_02_2024_10_00_00_bbbbbbbb',
+                  [('a', 100, 0, 1), ('b', 100, 0, 2), ('a', 100, 0, 3)])
+    (_, _, report), = get_price_report('DetMir', db_path=db_path, chunk_size=2)
+    assert report['Код'].tolist() == []
+    assert report['new'].tolist() == report['removed'].tolist() == []
+
+
+def test_snapshots_are_ordered_by_date(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    make_snapshot(db_path, 'DetMir_03_02_2024_10_00_00_aaaaaaaa', [])
+    # tables made before run ids were added have no seconds
+    make_snapshot(db_path, 'DetMir_02_02_2024_10_00', [])
+    make_snapshot(db_path, 'DetMir_01_03_2024_09_00_00_bbbbbbbb', [])
+    make_snapshot(db_path, 'DetMirOutlet_01_01_2024_10_00_00_cccccccc', [])
+    make_snapshot(db_path, 'DetMir_backup', [])
+    with sqlite3.connect(db_path) as connection:
+        assert get_snapshot_tables(connection, 'DetMir') == ['DetMir_02_02_2024_10_00',
+                                                             'DetMir_03_02_2024_10_00_00_aaaaaaaa',
+                                                             'DetMir_01_03_2024_09_00_00_bbbbbbbb']
+
+
+def test_unfinished_runs_are_skipped(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    make_snapshot(db_path, 'DetMir_01_02_2024_10_00_00_aaaaaaaa', [('a', 100, 0, 1), ('b', 100, 0, 2)])
+    make_snapshot(db_path, 'DetMir_02_02_2024_10_00_00_bbbbbbbb', [('a', 100, 0, 1)])
+    with sqlite3.connect(db_path) as connection:
+        create_checkpoint_tables(connection)
+        connection.execute("INSERT INTO crawl_runs (shop, url, table_name) VALUES ('DetMir', 'https://shop.test/', "
+                           "'DetMir_02_02_2024_10_00_00_bbbbbbbb')")
+        assert get_snapshot_tables(connection, 'DetMir') == ['DetMir_01_02_2024_10_00_00_aaaaaaaa']
+    assert get_price_report('DetMir', db_path=db_path) == []
+
+
+def test_reports_are_exported_to_csv(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    make_snapshot(db_path, 'DetMir_01_02_2024_10_00_00_aaaaaaaa', [('a', 100, 0, 1), ('c', 100, 0, 3)])
+    make_snapshot(db_path, 'DetMir_02_02_2024_10_00_00_bbbbbbbb', [('a', 90, 10, 2), ('d', 50, 0, 3)])
+    path = tmp_path / 'report.csv'
+    export_report(get_price_report('DetMir', db_path=db_path), path)
+    with open(path, encoding='utf-8', newline='') as file:
+        rows = list(csv.reader(file))
+    assert rows[0][:4] == ['Было', 'Стало', 'Изменение', 'Код']
+    assert [row[2:4] for row in rows[1:]] == [['Изменён', 'a'], ['Новый', 'd'], ['Удалён', 'c']]
+    assert rows[1][4:] == ['100.0', '90.0', '-10.0', '0.0', '10.0', '1.0', '2.0', '-1.0']
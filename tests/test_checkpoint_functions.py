@@ -0,0 +1,91 @@
+import sqlite3
+import pytest
+from core import Checkpoint, with_checkpoint, crawl_pages, open_sink, save_options, save_rows
+from settings import detmir_table_structure
+
+url = 'https://shop.test/catalog/'
+
+
+def make_rows(page_number):
+    # rows of detmir_table_structure, two products per page
+    return [('Товар', 100, 0, 100, 2 * (page_number - 1) + i + 1, 4.5, 10, '', f'p{page_number}-{i}', '', '')
+            for i in range(2)]
+
+
+def run_parse(db_path, resume=False, fail_on=None, no_data_on=None):
+    """
+    Parses five pages into a DbSink. The handler raises on page fail_on, page no_data_on is recorded as failed
+    """
+
+    fetched_pages = []
+    saved_pages = []
+
+    def fetch(page_url):
+        page_number = int(page_url.rsplit('=', 1)[1])
+        fetched_pages.append(page_number)
+        return make_rows(page_number)
+
+    def handle(page_number, rows):
+        if page_number == fail_on:
+            raise RuntimeError('parse crashed')
+        save_rows(rows, sink)
+
+    with Checkpoint('DetMir', url, resume, db_path=db_path) as checkpoint, \
+            open_sink(save_options['.db'], detmir_table_structure, 'DetMir', db_path=db_path,
+                      checkpoint=checkpoint) as sink:
+        checkpoint.set_page_amount(5)
+        checkpoint.on_pages_saved(saved_pages.extend)
+        handle_page = with_checkpoint(handle, sink)
+
+        def handle_or_fail(page_number, rows):
+            if page_number == no_data_on:
+                checkpoint.fail_page(page_number)
+                return
+            handle_page(page_number, rows)
+
+        urls = checkpoint.get_remaining({i: f'{url}?page={i}' for i in range(1, 6)})
+        crawl_pages(urls, fetch, handle_or_fail)
+    return sorted(fetched_pages), sorted(saved_pages), sink.table_name
+
+
+def get_codes(db_path, table_name):
+    with sqlite3.connect(db_path) as connection:
+        return sorted(code for (code,) in connection.execute(f'SELECT [Код товара на сайте] FROM {table_name}'))
+
+
+def get_runs(db_path):
+    with sqlite3.connect(db_path) as connection:
+        return connection.execute('SELECT table_name, finished IS NOT NULL FROM crawl_runs').fetchall()
+
+
+def test_resumed_parse_continues_after_the_last_saved_page(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    with pytest.raises(RuntimeError):
+        run_parse(db_path, fail_on=3)
+    (table_name, finished), = get_runs(db_path)
+    assert not finished
+    assert get_codes(db_path, table_name) == ['p1-0', 'p1-1', 'p2-0', 'p2-1']
+
+    fetched_pages, saved_pages, resumed_table_name = run_parse(db_path, resume=True)
+    assert fetched_pages == saved_pages == [3, 4, 5]
+    assert resumed_table_name == table_name
+    assert get_runs(db_path) == [(table_name, 1)]
+    assert get_codes(db_path, table_name) == sorted(f'p{page}-{i}' for page in range(1, 6) for i in range(2))
+
+
+def test_finished_parse_is_not_resumed(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    _, _, table_name = run_parse(db_path)
+    fetched_pages, _, new_table_name = run_parse(db_path, resume=True)
+    assert fetched_pages == [1, 2, 3, 4, 5]
+    assert new_table_name != table_name
+
+
+def test_failed_page_keeps_the_run_unfinished(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    fetched_pages, saved_pages, table_name = run_parse(db_path, no_data_on=4)
+    assert saved_pages == [1, 2, 3, 5]
+    assert get_runs(db_path) == [(table_name, 0)]
+    fetched_pages, saved_pages, _ = run_parse(db_path, resume=True)
+    assert fetched_pages == saved_pages == [4]
+    assert get_runs(db_path) == [(table_name, 1)]
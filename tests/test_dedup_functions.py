@@ -0,0 +1,48 @@
+from core import SeenSet, BloomFilter, get_seen_set, save_rows
+
+
+class ListSink:
+    def __init__(self):
+        self.rows = []
+
+    def save(self, row):
+        self.rows.append(row)
+
+
+def test_seen_set_accepts_a_code_once():
+    seen = SeenSet()
+    assert [seen.add(code) for code in ('a', 'b', 'a', 'c', 'b')] == [True, True, False, True, False]
+    assert len(seen) == 3
+
+
+def test_bloom_filter_never_takes_a_seen_code_for_a_new_one():
+    seen = BloomFilter(10000)
+    codes = [f'product-{i}' for i in range(10000)]
+    new_codes = sum(seen.add(code) for code in codes)
+    assert not any(seen.add(code) for code in codes)
+    # false positives are rare, so almost every new code is accepted
+    assert new_codes >= 9990
+    assert len(seen) == new_codes
+
+
+def test_bloom_filter_error_rate_is_kept_at_capacity():
+    seen = BloomFilter(20000, error_rate=0.001)
+    for i in range(20000):
+        seen.add(i)
+    # probes are added too, so only a few of them are made to keep the filter near its capacity
+    false_positives = sum(not seen.add(f'new-{i}') for i in range(2000))
+    assert false_positives < 2000 * 0.001 * 5
+
+
+def test_large_catalogs_get_a_bloom_filter():
+    assert isinstance(get_seen_set(10), SeenSet)
+    assert isinstance(get_seen_set(10, bloom_threshold=1000), BloomFilter)
+
+
+def test_shifted_products_are_saved_once():
+    sink = ListSink()
+    seen = get_seen_set(2)
+    # 'b' moved from the first page to the second one while the list was parsed
+    save_rows([('a', 1), ('b', 2)], sink, seen, key_index=0)
+    save_rows([('b', 3), ('c', 4)], sink, seen, key_index=0)
+    assert sink.rows == [('a', 1), ('b', 2), ('c', 4)]
@@ -0,0 +1,119 @@
+import html
+import json
+import pytest
+from core import get_attribute_json, get_script_json, iter_script_json, index_state_widgets, NoDataError
+from core import extraction_functions
+from core.degub_functions import make_test_page, make_listing_page, get_soup_listing_rows
+from core.extraction_functions import UnescapedReader, decode_entities, get_attribute
+from DetMir import DetMir_ParserMain
+from WildBerries import WildBerries_ParserMain
+
+data = {'items': [{'id': i, 'name': f'Товар "{i}" & <аксессуар>', 'price': {'price': f'{i} ₽'}}
+                  for i in range(5)]}
+
+
+class StandInSession:
+    def __init__(self, text):
+        self.text = text
+
+    def get(self, url):
+        return self
+
+
+@pytest.fixture(params=['ijson', 'json'])
+def json_backend(request, monkeypatch):
+    # values are decoded by ijson if it is installed, the whole data is decoded otherwise
+    if request.param == 'json':
+        monkeypatch.setattr(extraction_functions, 'ijson', None)
+    elif extraction_functions.ijson is None:
+        pytest.skip('ijson is not installed')
+    return request.param
+
+
+def test_embedded_json_is_extracted_without_parsing_the_page():
+    page = make_test_page(data)
+    assert get_attribute_json(page, 'state-searchResultsV2-312617-default-1') == data
+    assert get_script_json(page, 'app-data') == data
+    assert get_script_json(page, index=1, end='};', unescape=False) == data
+    assert index_state_widgets(page) == {'searchResultsV2': ['state-searchResultsV2-312617-default-1']}
+
+
+def test_missing_tags_give_none():
+    page = make_test_page(data)
+    assert get_attribute_json(page, 'state-other') is None
+    assert get_attribute_json(page, 'state-searchResultsV2-312617-default-1', 'data-other') is None
+    assert get_script_json(page, 'other-data') is None
+
+
+def test_attribute_of_a_later_tag_is_not_taken():
+    page = '<div id="widget" class="a">text</div><div data-state="{}"></div>'
+    assert get_attribute(page, 'widget', 'data-state') is None
+    assert get_attribute('<div data-state="{&quot;a&quot;: 1}" id="widget">', 'widget', 'data-state') == '{"a": 1}'
+
+
+def test_entities_are_decoded_once():
+    assert decode_entities('&amp;quot; &quot;') == '&quot; "'
+    assert decode_entities('&nbsp;&amp;') == '\xa0&'
+    assert decode_entities('no entities') == 'no entities'
+
+
+def test_entities_cut_by_chunks_are_decoded():
+    text = html.escape(json.dumps({'name': '"Товар" & <аксессуар>'}, ensure_ascii=False))
+    page = f'<p>{text}</p>'
+    reader = UnescapedReader(page, 3, 3 + len(text))
+    chunks = []
+    while True:
+        chunk = reader.read(7)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    assert json.loads(b''.join(chunks)) == {'name': '"Товар" & <аксессуар>'}
+
+
+def test_values_are_yielded_by_path(json_backend):
+    page = make_test_page(data)
+    assert list(iter_script_json(page, 'items.item', 'app-data')) == data['items']
+    assert list(iter_script_json(page, 'items.item.price.price', 'app-data')) == [f'{i} ₽' for i in range(5)]
+
+
+def test_empty_array_yields_nothing(json_backend):
+    page = make_test_page({'items': []})
+    assert list(iter_script_json(page, 'items.item', 'app-data')) == []
+
+
+def test_missing_path_raises_no_data_error(json_backend):
+    page = make_test_page({'catalog': {'error': 'blocked'}})
+    with pytest.raises(NoDataError):
+        list(iter_script_json(page, 'catalog.data.items.item', 'app-data'))
+
+
+def test_missing_script_raises_no_data_error_at_once():
+    with pytest.raises(NoDataError):
+        iter_script_json('<html><body>captcha</body></html>', 'items.item', 'app-data')
+
+
+def test_detmir_page_amount_without_data_raises_no_data_error():
+    page = make_test_page({'catalog': {'data': {'items': []}}})
+    with pytest.raises(NoDataError):
+        DetMir_ParserMain.get_page_amount('https://www.detmir.ru/catalog/page/1/', StandInSession(page))
+
+
+def test_detmir_page_amount_and_first_page():
+    products = [{'id': i} for i in range(30)]
+    page = make_test_page({'catalog': {'data': {'meta': {'length': 61}, 'items': products}}})
+    page_amount, first_page = DetMir_ParserMain.get_page_amount('https://www.detmir.ru/catalog/page/1/',
+                                                                StandInSession(page))
+    assert page_amount == 3
+    assert list(first_page) == products
+
+
+def test_wildberries_one_pass_extraction_matches_beautifulsoup():
+    page = make_listing_page(30, markup_size=10)
+    rows = WildBerries_ParserMain.extract_rows(page, 1)
+    assert len(rows) == 30
+    assert rows == get_soup_listing_rows(page)
+
+
+def test_wildberries_page_without_product_list_raises_no_data_error():
+    with pytest.raises(NoDataError):
+        WildBerries_ParserMain.extract_rows('<html><body>captcha</body></html>', 1)
@@ -0,0 +1,98 @@
+import pytest
+from core import PageFingerprints, DiskCache, check_partial_parse, save_options, with_checkpoint
+from settings import detmir_table_structure
+
+url = 'https://shop.test/catalog/?sort=new'
+
+
+class ListSink:
+    def __init__(self):
+        self.rows = []
+        self.completed_pages = []
+
+    def save(self, row):
+        self.rows.append(row)
+
+    def complete_page(self, page_number):
+        self.completed_pages.append(page_number)
+
+
+def make_page(page_number, price=100):
+    # rows of detmir_table_structure, three products per page
+    return [('Товар', price, 0, price, 3 * (page_number - 1) + i + 1, 4.5, 10, '', f'p{page_number}-{i}', '', '')
+            for i in range(3)]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with DiskCache('DetMir_fingerprints', None, db_path=str(tmp_path / 'cache.db')) as fingerprint_cache:
+        yield fingerprint_cache
+
+
+def run_parse(cache, pages, incremental=True, full_parse_interval=24 * 60 * 60):
+    """
+    Saves the given pages in a format of {page number: rows} until the parse can stop
+
+    :return: numbers of parsed pages
+    """
+
+    with PageFingerprints('DetMir', url, incremental, 2, full_parse_interval, cache) as fingerprints:
+        sink = fingerprints.attach(ListSink(), detmir_table_structure)
+        for page_number, rows in pages.items():
+            if fingerprints.stop.is_set():
+                break
+            for row in rows:
+                sink.save(row)
+            sink.complete_page(page_number)
+    return sink.sink.completed_pages
+
+
+def test_incremental_parse_stops_on_unchanged_pages(cache):
+    pages = {i: make_page(i) for i in range(1, 7)}
+    assert run_parse(cache, pages) == [1, 2, 3, 4, 5, 6]
+    pages[1] = make_page(1, 90)
+    # pages 2 and 3 are equal to the previous parse, so the rest is skipped
+    assert run_parse(cache, pages) == [1, 2, 3]
+
+
+def test_changed_pages_break_the_run_of_unchanged_pages(cache):
+    pages = {i: make_page(i) for i in range(1, 7)}
+    run_parse(cache, pages)
+    for page_number in (1, 3, 5):
+        pages[page_number] = make_page(page_number, 90)
+    assert run_parse(cache, pages) == [1, 2, 3, 4, 5, 6]
+
+
+def test_stale_full_parse_is_not_stopped(cache):
+    pages = {i: make_page(i) for i in range(1, 7)}
+    run_parse(cache, pages)
+    assert run_parse(cache, pages, full_parse_interval=0) == [1, 2, 3, 4, 5, 6]
+
+
+def test_not_incremental_parse_is_not_stopped(cache):
+    pages = {i: make_page(i) for i in range(1, 7)}
+    run_parse(cache, pages)
+    assert run_parse(cache, pages, incremental=False) == [1, 2, 3, 4, 5, 6]
+
+
+def test_empty_page_matches_only_if_revalidation_found_it_unchanged(cache):
+    with PageFingerprints('DetMir', url, True, 2, 24 * 60 * 60, cache) as fingerprints:
+        sink = fingerprints.attach(ListSink(), detmir_table_structure)
+        fingerprints.full_parse = False
+        handle = fingerprints.track(with_checkpoint(lambda page_number, rows: None, sink))
+        # all products of the page were seen on earlier pages
+        handle(1, [])
+        handle(2, [])
+        assert not fingerprints.stop.is_set()
+        # pages that were not changed since the previous parse
+        handle(3, None)
+        handle(4, None)
+        assert fingerprints.stop.is_set()
+        assert fingerprints.matches == {1: False, 2: False, 3: True, 4: True}
+
+
+def test_incremental_parse_needs_history_save_option():
+    check_partial_parse(save_options['.history'], 'incremental')
+    for save_option in ('.db', '.jsonl.gz', '.csv.gz'):
+        with pytest.raises(ValueError):
+            check_partial_parse(save_options[save_option], 'incremental')
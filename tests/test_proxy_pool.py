@@ -0,0 +1,116 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import pytest
+from core import ProxyPool
+
+# target of the requests. Stand-in proxies answer by themselves, so the host is never resolved
+target_url = 'http://shop.test/catalog/'
+
+
+class StandInProxy:
+    """
+    Local http proxy that answers every request with the given status and its own name
+    """
+
+    def __init__(self, name, status=200):
+        self.name = name
+        self.status = status
+        self.requests = []
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                proxy.requests.append((self.path, self.headers.get('User-Agent')))
+                body = proxy.name.encode()
+                self.send_response(proxy.status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def proxies():
+    started = [StandInProxy(f'proxy{i}') for i in range(3)]
+    yield started
+    for proxy in started:
+        proxy.close()
+
+
+def get_pool(proxies, **kwargs):
+    return ProxyPool([proxy.url for proxy in proxies], timeout=(1, 2), check_url=target_url, **kwargs)
+
+
+def run_in_threads(function, amount, name='fetch_0'):
+    # every thread gets the same name, like the fetching threads of parses that run at the same time
+    results = [None] * amount
+    barrier = threading.Barrier(amount)
+
+    def run(i):
+        barrier.wait()
+        results[i] = function()
+
+    threads = [threading.Thread(target=run, args=(i,), name=name) for i in range(amount)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_requests_go_through_proxies(proxies):
+    pool = get_pool(proxies)
+    response = pool.get_session().get(target_url)
+    assert response.text in {proxy.name for proxy in proxies}
+    proxy = next(proxy for proxy in proxies if proxy.name == response.text)
+    assert proxy.requests[0][0] == target_url
+
+
+def test_sessions_are_sticky(proxies):
+    pool = get_pool(proxies)
+    session = pool.get_session()
+    names = {session.get(target_url).text for _ in range(5)}
+    assert pool.get_session() is session
+    assert len(names) == 1
+
+
+def test_concurrent_workers_with_same_thread_name_get_own_sessions(proxies):
+    pool = get_pool(proxies)
+    sessions = run_in_threads(pool.get_session, 3)
+    assert len({id(session) for session in sessions}) == 3
+    # every worker gets the least used proxy
+    assert sorted(session.proxies['http'] for session in sessions) == sorted(proxy.url for proxy in proxies)
+
+
+def test_blocked_proxy_is_taken_out_of_rotation(proxies):
+    proxies[0].status = 403
+    pool = get_pool(proxies[:2], max_failures=2)
+    # both proxies are unused, so the first one is chosen
+    session = pool.get_session('worker')
+    assert session.proxies['http'] == proxies[0].url
+    for _ in range(2):
+        session.get(target_url)
+    assert pool.proxies[proxies[0].url]['banned_until'] > 0
+    new_session = pool.get_session('worker')
+    assert new_session is not session
+    assert new_session.get(target_url).text == proxies[1].name
+
+
+def test_check_all_skips_dead_and_blocked_proxies(proxies):
+    proxies[1].status = 403
+    proxies[2].close()
+    pool = get_pool(proxies)
+    assert pool.check_all() == [proxies[0].url]
+    for _ in range(5):
+        assert pool.get_session(object()).proxies['http'] == proxies[0].url
@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import sqlite3
+import time
+from core import SqliteTaskQueue, work
+
+
+def run_worker(queue_path, log_path, worker, lease_time):
+    """
+    Worker process of the tests. Every attempt is logged before the task runs. A task fails on its first attempt
+    with 'fail' and its worker dies on its first attempt with 'crash'
+    """
+
+    log = sqlite3.connect(log_path, timeout=60)
+
+    def run_task(task):
+        with log:
+            attempt = log.execute('SELECT count(*) FROM attempts WHERE task = ?', (task['task'],)).fetchone()[0]
+            log.execute('INSERT INTO attempts VALUES (?, ?)', (task['task'], worker))
+        if task['mode'] == 'always_fail' or (task['mode'] == 'fail' and attempt == 0):
+            raise RuntimeError(f'task {task["task"]} failed')
+        if task['mode'] == 'crash' and attempt == 0:
+            os._exit(1)
+
+    with SqliteTaskQueue(queue_path, max_attempts=3, retry_delay=0) as task_queue:
+        work(task_queue, run_task, worker, lease_time, poll_interval=0.05)
+    log.close()
+
+
+def run_workers(tmp_path, tasks, worker_amount=4, lease_time=60.0):
+    queue_path = str(tmp_path / 'queue.db')
+    log_path = str(tmp_path / 'log.db')
+    with sqlite3.connect(log_path) as log:
+        log.execute('CREATE TABLE attempts (task INTEGER, worker TEXT)')
+    with SqliteTaskQueue(queue_path) as task_queue:
+        task_queue.add({'task': i, 'mode': mode} for i, mode in enumerate(tasks))
+    workers = [multiprocessing.Process(target=run_worker, args=(queue_path, log_path, f'worker-{i}', lease_time))
+               for i in range(worker_amount)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(120)
+        assert not worker.is_alive()
+    with sqlite3.connect(log_path) as log:
+        attempts = log.execute('SELECT task, count(*), count(DISTINCT worker) FROM attempts GROUP BY task').fetchall()
+    with sqlite3.connect(queue_path) as connection:
+        statuses = connection.execute('SELECT status, attempts FROM tasks ORDER BY task_id').fetchall()
+    return {task: (amount, worker_amount) for task, amount, worker_amount in attempts}, statuses
+
+
+def test_every_task_is_claimed_once(tmp_path):
+    attempts, statuses = run_workers(tmp_path, ['ok'] * 200)
+    assert statuses == [('done', 1)] * 200
+    assert attempts == {task: (1, 1) for task in range(200)}
+
+
+def test_failed_tasks_are_requeued(tmp_path):
+    tasks = ['ok', 'fail', 'always_fail'] * 20
+    attempts, statuses = run_workers(tmp_path, tasks)
+    for task, mode in enumerate(tasks):
+        if mode == 'ok':
+            assert statuses[task] == ('done', 1)
+            assert attempts[task][0] == 1
+        elif mode == 'fail':
+            assert statuses[task] == ('done', 2)
+            assert attempts[task][0] == 2
+        else:
+            assert statuses[task] == ('failed', 3)
+            assert attempts[task][0] == 3
+
+
+def test_tasks_of_crashed_workers_are_requeued(tmp_path):
+    tasks = ['ok'] * 10 + ['crash'] * 2
+    attempts, statuses = run_workers(tmp_path, tasks, lease_time=1.0)
+    assert statuses == [('done', 1)] * 10 + [('done', 2)] * 2
+    for task in (10, 11):
+        amount, worker_amount = attempts[task]
+        # the worker that crashed is gone, so another worker completed the task
+        assert amount == 2 and worker_amount == 2
+
+
+def test_expired_lease_can_not_complete_or_fail_the_task(tmp_path):
+    with SqliteTaskQueue(str(tmp_path / 'queue.db'), retry_delay=0) as task_queue:
+        task_queue.add([{'task': 0}])
+        task_id, payload, attempt = task_queue.lease('worker-a', 0.01)
+        time.sleep(0.05)
+        assert task_queue.lease('worker-b', 60) == (task_id, payload, 2)
+        assert not task_queue.complete(task_id, 'worker-a')
+        assert not task_queue.fail(task_id, 'worker-a', 'late error')
+        assert task_queue.get_counts() == {'leased': 1}
+        assert task_queue.complete(task_id, 'worker-b')
+        assert not task_queue.complete(task_id, 'worker-b')
+        assert task_queue.get_counts() == {'done': 1}
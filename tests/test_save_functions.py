@@ -0,0 +1,122 @@
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import pytest
+from core import save_options, open_sink, save_row, Checkpoint
+from core.save_functions import DbSink, HistorySink
+from settings import detmir_table_structure
+
+
+def make_row(code, popularity=1, price=100, name='Товар'):
+    # row of detmir_table_structure
+    return name, price, 0, price, popularity, 4.5, 10, 'https://img.test/1.jpg', code, 'A-' + code, 'В наличии'
+
+
+def read_table(db_path, table_name):
+    with sqlite3.connect(db_path) as connection:
+        return connection.execute(f'SELECT [Код товара на сайте], Популярность, Итого FROM {table_name} '
+                                  f'ORDER BY Популярность').fetchall()
+
+
+def test_db_sink_writes_rows_in_batches(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    with DbSink(detmir_table_structure, 'DetMir', batch_size=3, db_path=db_path) as sink:
+        for i in range(4):
+            save_row(make_row(f'p{i}', i + 1), sink)
+        # a full batch is written at once, the rest stays in the buffer
+        assert len(read_table(db_path, sink.table_name)) == 3
+    assert read_table(db_path, sink.table_name) == [(f'p{i}', i + 1, 100) for i in range(4)]
+
+
+def test_db_sink_keeps_the_best_rank_of_a_product(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    with DbSink(detmir_table_structure, 'DetMir', db_path=db_path) as sink:
+        sink.save(make_row('a', 5, 100))
+        # the product moved to a later page during the parse
+        sink.save(make_row('a', 40, 90))
+        sink.save(make_row('b', 7, 100))
+        # a retried page has the same ranks and refreshes its rows
+        sink.save(make_row('b', 7, 80))
+        sink.save(make_row('c', 9, 100))
+        sink.save(make_row('c', 2, 70))
+    assert read_table(db_path, sink.table_name) == [('c', 2, 70), ('a', 5, 100), ('b', 7, 80)]
+
+
+def test_db_sink_writes_only_rows_of_completed_pages(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    with Checkpoint('DetMir', 'https://shop.test/', db_path=db_path) as checkpoint:
+        with DbSink(detmir_table_structure, 'DetMir', db_path=db_path, checkpoint=checkpoint) as sink:
+            sink.save(make_row('a', 1))
+            sink.complete_page(1)
+            sink.save(make_row('b', 2))
+            sink.flush()
+            assert read_table(db_path, sink.table_name) == [('a', 1, 100)]
+            assert checkpoint.completed_pages == {1}
+    # the rows of the unfinished page are dropped, the page is parsed again on resume
+    assert read_table(db_path, sink.table_name) == [('a', 1, 100)]
+
+
+def test_history_sink_records_only_changes(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    with HistorySink(detmir_table_structure, 'DetMir', db_path=db_path) as sink:
+        sink.save(make_row('a', 1, 100))
+        sink.save(make_row('b', 2, 100))
+    # the next parse: popularity is not tracked, only the price of 'b' changed
+    with HistorySink(detmir_table_structure, 'DetMir', db_path=db_path) as sink:
+        sink.save(make_row('a', 10, 100))
+        sink.save(make_row('b', 20, 90))
+    with sqlite3.connect(db_path) as connection:
+        products = connection.execute('SELECT code, final_price FROM products ORDER BY code').fetchall()
+        history = connection.execute('SELECT code, final_price FROM price_history ORDER BY rowid').fetchall()
+    assert products == [('a', 100), ('b', 90)]
+    assert history == [('a', 100), ('b', 100), ('b', 90)]
+
+
+def test_history_sink_keeps_shops_apart(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    with HistorySink(detmir_table_structure, 'DetMir', db_path=db_path) as sink:
+        sink.save(make_row('a'))
+    with HistorySink(detmir_table_structure, 'Ozon', db_path=db_path) as sink:
+        sink.save(make_row('a'))
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute('SELECT shop FROM price_history ORDER BY shop').fetchall() == [('DetMir',),
+                                                                                               ('Ozon',)]
+
+
+def test_jsonl_sink_splits_files(tmp_path):
+    with open_sink(save_options['.jsonl.gz'], detmir_table_structure, 'DetMir', directory=str(tmp_path),
+                   max_file_size=1) as sink:
+        for i in range(3):
+            sink.save(make_row(str(i), i + 1))
+    file_names = sorted(os.listdir(tmp_path))
+    assert file_names == [f'{sink.table_name}_{part:04}.jsonl.gz' for part in range(1, 4)]
+    rows = []
+    for file_name in file_names:
+        with gzip.open(tmp_path / file_name, 'rt', encoding='utf-8') as file:
+            rows.extend(json.loads(line) for line in file)
+    assert [row['Код товара на сайте'] for row in rows] == ['0', '1', '2']
+    assert rows[0]['Название'] == 'Товар'
+
+
+def test_csv_sink_writes_a_header(tmp_path):
+    with open_sink(save_options['.csv.gz'], detmir_table_structure, 'DetMir', directory=str(tmp_path)) as sink:
+        sink.save(make_row('a', 1))
+    with gzip.open(tmp_path / f'{sink.table_name}_0001.csv.gz', 'rt', encoding='utf-8', newline='') as file:
+        header, row = list(csv.reader(file))
+    assert header[8] == 'Код товара на сайте'
+    assert row[8] == 'a'
+
+
+def test_file_sinks_can_not_be_resumed(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    with Checkpoint('DetMir', 'https://shop.test/', db_path=db_path) as checkpoint:
+        with DbSink(detmir_table_structure, 'DetMir', db_path=db_path, checkpoint=checkpoint):
+            pass
+    with sqlite3.connect(db_path) as connection:
+        connection.execute('UPDATE crawl_runs SET finished = NULL')
+    with Checkpoint('DetMir', 'https://shop.test/', resume=True, db_path=db_path) as checkpoint:
+        with pytest.raises(ValueError):
+            open_sink(save_options['.jsonl.gz'], detmir_table_structure, 'DetMir', directory=str(tmp_path),
+                      checkpoint=checkpoint)
@@ -0,0 +1,101 @@
+import threading
+import pytest
+from core import RowWriter, WriterError, use_writer, save_row
+
+
+class ListSink:
+    """
+    Sink that keeps saved rows in memory and records the thread of every call. Rows equal to fail_row raise
+    """
+
+    def __init__(self, fail_row=None):
+        self.fail_row = fail_row
+        self.rows = []
+        self.calls = []
+        self.threads = set()
+        self.closed = False
+
+    def save(self, row):
+        self.threads.add(threading.current_thread().name)
+        if row == self.fail_row:
+            raise ValueError(f'can not save {row}')
+        self.rows.append(row)
+
+    def complete_page(self, page_number):
+        self.calls.append(('complete_page', page_number, len(self.rows)))
+
+    def flush(self):
+        self.calls.append(('flush', len(self.rows)))
+
+    def close(self):
+        self.closed = True
+
+
+def test_rows_are_saved_in_order_on_the_writer_thread():
+    sink = ListSink()
+    with RowWriter(maxsize=5) as writer:
+        queued_sink = writer.attach(sink)
+        for i in range(100):
+            save_row((i,), queued_sink)
+        queued_sink.flush()
+        assert sink.rows == [(i,) for i in range(100)]
+        assert sink.calls == [('flush', 100)]
+    assert sink.threads == {'RowWriter'}
+
+
+def test_completed_pages_follow_their_rows():
+    sink = ListSink()
+    with RowWriter() as writer:
+        with writer.attach(sink) as queued_sink:
+            queued_sink.save((1,))
+            queued_sink.complete_page(1)
+            queued_sink.save((2,))
+            queued_sink.complete_page(2)
+    assert sink.calls == [('complete_page', 1, 1), ('complete_page', 2, 2)]
+    assert sink.closed
+
+
+def test_write_errors_are_raised_in_the_parsing_thread():
+    sink = ListSink(fail_row=(2,))
+    with RowWriter() as writer:
+        queued_sink = writer.attach(sink)
+        for i in range(4):
+            queued_sink.save((i,))
+        with pytest.raises(WriterError):
+            queued_sink.flush()
+        # the error is raised once, later rows are saved
+        queued_sink.save((5,))
+        queued_sink.flush()
+    assert sink.rows == [(0,), (1,), (3,), (5,)]
+
+
+def test_errors_go_to_the_parse_of_their_sink():
+    failing_sink = ListSink(fail_row=(1,))
+    sink = ListSink()
+    with RowWriter() as writer:
+        failing_queued_sink = writer.attach(failing_sink)
+        queued_sink = writer.attach(sink)
+        failing_queued_sink.save((1,))
+        queued_sink.save((1,))
+        queued_sink.flush()
+        with pytest.raises(WriterError):
+            failing_queued_sink.flush()
+    assert sink.rows == [(1,)]
+
+
+def test_save_row_does_not_hide_writer_errors():
+    sink = ListSink(fail_row=(1,))
+    with RowWriter() as writer:
+        queued_sink = writer.attach(sink)
+        queued_sink.save((1,))
+        writer.queue.join()
+        with pytest.raises(WriterError):
+            save_row((2,), queued_sink)
+
+
+def test_shared_writer_is_not_closed_by_a_parse():
+    with RowWriter() as writer:
+        with use_writer(writer) as parse_writer:
+            assert parse_writer is writer
+        assert writer.thread.is_alive()
+    assert not writer.thread.is_alive()